@@ -1,29 +1,115 @@
 # admin_pages.py
-import os
+import math
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 import streamlit as st
 from db import (
     get_connection,
     admin_log,
     delete_uploaded_file_and_cards,
+    count_users,
+    get_all_users,
+    get_users_overview,
+    users_version,
+    bump_users_version,
+    update_user_password,
+    delete_user,
+)
+from auth import hash_password, MIN_PASSWORD_LENGTH
+from admin_utils import (
+    invalidate_username_cache,
+    remove_files,
 )
-from auth import hash_password
 
-def render_admin_users(real_user_id: int):
-    st.title("🔐 Admin – User Management")
+USERS_PER_PAGE = 50
+
+
+@st.cache_data(ttl=30, show_spinner=False)
+def _user_search_index(version: int):
+    """
+    All users as parallel arrays (ids, lowercased names), ordered by username,
+    so a search is one vectorised pass instead of a Python loop over tuples.
+    """
+    rows = get_all_users()
+    ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+    names = np.array([r[1].lower() for r in rows], dtype=str)
+    return ids, names
+
+
+@st.cache_data(ttl=30, show_spinner=False)
+def _list_users(version: int, page: int, query: str = ""):
+    """
+    Cached (total_users, page_rows) for the admin list. `version` is
+    db.users_version(), bumped by every user mutation in any session, so edits
+    are visible immediately; the TTL is a safety net.
+    """
+    offset = page * USERS_PER_PAGE
+    if not query:
+        return count_users(), get_users_overview(limit=USERS_PER_PAGE, offset=offset)
+
+    ids, names = _user_search_index(version)
+    matched = ids[np.char.find(names, query) >= 0]
+    page_ids = matched[offset:offset + USERS_PER_PAGE].tolist()
+    return len(matched), get_users_overview(limit=USERS_PER_PAGE, user_ids=page_ids)
+
+
+@st.cache_resource
+def _pw_pool():
+    # bcrypt is deliberately slow; hash off the script thread so the page stays responsive
+    return ThreadPoolExecutor(max_workers=2)
+
+
+def _password_policy_error(password: str):
+    """Return an error message if the password fails policy, else None."""
+    if len(password) < MIN_PASSWORD_LENGTH:
+        return f"Password must be at least {MIN_PASSWORD_LENGTH} characters."
+    return None
+
+
+def _change_password_job(uid: int, real_user_id: int, new_pw: str) -> None:
+    """Hash and store a new password; runs to completion even if the admin navigates away."""
+    update_user_password(uid, hash_password(new_pw))
+    admin_log(real_user_id, uid, "Admin changed user password")
+
+
+@st.fragment(run_every=0.25)
+def _password_change_status(uid: int):
+    """
+    Reports a pending password change. Only rendered while the job is
+    pending; the rerun on completion stops the polling.
+    """
+    fut_key = f"pw_fut_{uid}"
+    pw_future = st.session_state.get(fut_key)
+    if pw_future is None:
+        return
+    if not pw_future.done():
+        st.info("Updating password…")
+        return
+
+    st.session_state.pop(fut_key, None)
+    # Shown by the row on its next run, which no longer renders this poller
+    st.session_state[f"pw_status_{uid}"] = pw_future.exception() is None
+    st.rerun()
+
+
+@st.fragment
+def _user_row(uid: int, uname: str, n_files: int, n_attempts: int, real_user_id: int):
+    """
+    One user's row. Widget interaction inside reruns only this fragment; a full
+    rerun is triggered only when the list itself changes (rename, delete).
+    """
+    st.markdown(f"#### User ID {uid}: {uname}")
+    st.caption(f"Uploaded files: {n_files} · Attempts: {n_attempts}")
+
+    # Only build the edit widgets for rows the admin opened; a collapsed
+    # st.expander would still execute (and register) everything inside it.
+    if not st.toggle("Manage user", key=f"manage_user_{uid}"):
+        return
 
     conn = get_connection()
     cur = conn.cursor()
-    cur.execute("SELECT id, username FROM users ORDER BY username")
-    users = cur.fetchall()
-
-    if st.button("⬅ Back to App"):
-        st.session_state.view = "main"
-        st.rerun()
-
-    st.markdown("### 👥 All Users")
-
-    for uid, uname in users:
-        st.markdown(f"#### User ID {uid}: {uname}")
+    try:
         col1, col2, col3 = st.columns(3)
 
         # Rename user
@@ -36,8 +122,10 @@ def render_admin_users(real_user_id: int):
             if st.button(f"Save username {uid}", key=f"btn_rename_{uid}"):
                 cur.execute("UPDATE users SET username=? WHERE id=?", (new_name, uid))
                 conn.commit()
+                invalidate_username_cache()
                 admin_log(real_user_id, uid, f"Renamed user '{uname}' to '{new_name}'")
                 st.success("Username updated.")
+                bump_users_version()
                 st.rerun()
 
         # Change password
@@ -47,26 +135,36 @@ def render_admin_users(real_user_id: int):
                 type="password",
                 key=f"newpw_{uid}",
             )
+            fut_key = f"pw_fut_{uid}"
+            status_key = f"pw_status_{uid}"
             if st.button(f"Change password {uid}", key=f"btn_pw_{uid}"):
-                if len(new_pw) < 6:
-                    st.error("Password must be at least 6 characters.")
+                st.session_state.pop(status_key, None)
+                error = _password_policy_error(new_pw)
+                if error:
+                    st.error(error)
+                elif fut_key in st.session_state:
+                    st.info("A password change is already in progress.")
                 else:
-                    pw_hash = hash_password(new_pw)
-                    cur.execute("UPDATE users SET password_hash=? WHERE id=?", (pw_hash, uid))
-                    conn.commit()
-                    admin_log(real_user_id, uid, "Admin changed user password")
+                    st.session_state[fut_key] = _pw_pool().submit(
+                        _change_password_job, uid, real_user_id, new_pw
+                    )
+
+            if fut_key in st.session_state:
+                _password_change_status(uid)
+            elif status_key in st.session_state:
+                if st.session_state[status_key]:
                     st.success("Password changed.")
-                    st.rerun()
+                else:
+                    st.error("Password change failed.")
 
         # Delete user
         with col3:
             if uname == "admin":
                 st.write("(cannot delete admin)")
             else:
-                delete_key = f"delete_user_{uid}"
                 confirm_key = f"confirm_delete_user_{uid}"
 
-                if st.button("Delete user", key=delete_key):
+                if st.button("Delete user", key=f"delete_user_{uid}"):
                     st.session_state[confirm_key] = True
 
                 if st.session_state.get(confirm_key):
@@ -74,25 +172,13 @@ def render_admin_users(real_user_id: int):
                     c1, c2 = st.columns(2)
 
                     with c1:
-                        if st.button("Yes, delete", key=f"yes_{delete_key}"):
-                            # Delete attempts
-                            cur.execute("DELETE FROM card_attempts WHERE user_id=?", (uid,))
-
-                            # Delete uploaded files from disk
-                            cur.execute("SELECT stored_path FROM uploaded_files WHERE user_id=?", (uid,))
-                            for (path,) in cur.fetchall():
-                                if path and os.path.exists(path):
-                                    try:
-                                        os.remove(path)
-                                    except OSError:
-                                        pass
-
-                            # Delete uploaded files metadata
-                            cur.execute("DELETE FROM uploaded_files WHERE user_id=?", (uid,))
-                            # (add any other cascading deletes you already had here)
-                            # Finally delete user
-                            cur.execute("DELETE FROM users WHERE id=?", (uid,))
-                            conn.commit()
+                        if st.button("Yes, delete", key=f"yes_delete_user_{uid}"):
+                            # One write transaction; dependents go via ON DELETE CASCADE
+                            stored_paths = delete_user(uid)
+
+                            # Only unlink files once the delete has committed
+                            remove_files(stored_paths)
+                            invalidate_username_cache()
 
                             admin_log(real_user_id, uid, "Deleted user account")
                             st.success("User deleted.")
@@ -100,8 +186,52 @@ def render_admin_users(real_user_id: int):
                             st.rerun()
 
                     with c2:
-                        if st.button("Cancel", key=f"cancel_{delete_key}"):
-                            st.session_state.pop(confirm_key, None)
-                            st.rerun()
+                        # Callback runs before the (fragment) rerun, so no explicit rerun needed
+                        st.button(
+                            "Cancel",
+                            key=f"cancel_delete_user_{uid}",
+                            on_click=st.session_state.pop,
+                            args=(confirm_key, None),
+                        )
+    finally:
+        conn.close()
+
+
+def render_admin_users(real_user_id: int):
+    st.title("🔐 Admin – User Management")
+
+    if st.button("⬅ Back to App"):
+        st.session_state.view = "main"
+        st.rerun()
+
+    st.markdown("### 👥 All Users")
 
-    conn.close()
\ No newline at end of file
+    query = st.text_input("Search users", key="admin_users_search").strip().lower()
+    if query != st.session_state.get("admin_users_last_query", ""):
+        st.session_state["admin_users_page"] = 0
+        st.session_state["admin_users_last_query"] = query
+
+    # Paginate the user list; counts come from one aggregate query per page
+    version = users_version()
+    page = st.session_state.get("admin_users_page", 0)
+    total, users = _list_users(version, page, query)
+    total_pages = max(1, math.ceil(total / USERS_PER_PAGE))
+    if page > total_pages - 1:
+        page = total_pages - 1
+        total, users = _list_users(version, page, query)
+    st.session_state["admin_users_page"] = page
+
+    col_prev, col_page, col_next = st.columns([1, 2, 1])
+    with col_prev:
+        if st.button("⬅ Previous page", disabled=(page == 0), key="admin_users_prev"):
+            st.session_state["admin_users_page"] = page - 1
+            st.rerun()
+    with col_page:
+        st.write(f"Page {page + 1} of {total_pages}")
+    with col_next:
+        if st.button("Next page ➡", disabled=(page >= total_pages - 1), key="admin_users_next"):
+            st.session_state["admin_users_page"] = page + 1
+            st.rerun()
+
+    for uid, uname, n_files, n_attempts in users:
+        _user_row(uid, uname, n_files, n_attempts, real_user_id)
@@ -1,85 +1,135 @@
 # admin_utils.py
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 
 import streamlit as st
 
-from db import get_connection, admin_log
+from db import (
+    pooled_connection,
+    delete_uploaded_files_returning_paths,
+    admin_log,
+    cached_get_subjects,
+    clear_card_caches,
+    clear_file_caches,
+)
+
+# Negative cache for (subject_id, user_id) pairs known not to exist:
+# key -> monotonic expiry. Short TTL keeps staleness harmless.
+_MISSING_SUBJECT_TTL = 5.0
+_missing_subjects: dict = {}
+
+
+def _remember_missing_subject(key) -> None:
+    now = time.monotonic()
+    # Prune expired entries on insert so the dict stays bounded by the TTL window.
+    # Iterate a snapshot and pop tolerantly; other sessions run on other threads.
+    for k, exp in list(_missing_subjects.items()):
+        if exp <= now:
+            _missing_subjects.pop(k, None)
+    _missing_subjects[key] = now + _MISSING_SUBJECT_TTL
+
+
+def _get_username_by_id_raw(user_id: int) -> str:
+    with pooled_connection() as conn:
+        row = conn.execute("SELECT username FROM users WHERE id = ?", (user_id,)).fetchone()
+    return row[0] if row else f"user_{user_id}"
+
+
+_get_username_by_id_cached = lru_cache(maxsize=1024)(_get_username_by_id_raw)
 
 
 def get_username_by_id(user_id: int) -> str:
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT username FROM users WHERE id = ?", (user_id,))
-    row = cur.fetchone()
-    conn.close()
-    return row[0] if row else f"user_{user_id}"
+    return _get_username_by_id_cached(user_id)
 
 
-def delete_subject_and_data(subject_id: int, effective_user_id: int, real_user_id: int):
+def invalidate_username_cache() -> None:
+    """Call after renaming or deleting a user."""
+    _get_username_by_id_cached.cache_clear()
+
+
+def _safe_unlink(path: str) -> None:
+    # EAFP: a single unlink instead of exists() + remove()
+    try:
+        os.unlink(path)
+    except OSError:
+        # Includes FileNotFoundError: already gone is fine
+        pass
+
+
+def remove_files(paths) -> None:
     """
-    Delete a subject and all its cards, attempts, and uploaded files for the effective user.
+    Best-effort removal of uploaded files from disk. Unlinks run on a thread
+    pool so large batches overlap their syscalls instead of running serially.
     """
-    conn = get_connection()
-    cur = conn.cursor()
-
-    # Get subject name for logging
-    cur.execute(
-        "SELECT name FROM subjects WHERE id = ? AND user_id = ?",
-        (subject_id, effective_user_id),
-    )
-    row = cur.fetchone()
-    if not row:
-        conn.close()
-        st.error("Subject not found or does not belong to this user.")
+    paths = [p for p in paths if p]
+    if not paths:
         return
+    if len(paths) == 1:
+        _safe_unlink(paths[0])
+        return
+    with ThreadPoolExecutor(max_workers=min(16, len(paths))) as ex:
+        list(ex.map(_safe_unlink, paths))
 
-    subj_name = row[0]
-
-    # Get all cards for this subject
-    cur.execute("SELECT id FROM cards WHERE subject_id = ?", (subject_id,))
-    card_ids = [r[0] for r in cur.fetchall()]
-
-    # Delete attempts for these cards and this user
-    if card_ids:
-        placeholders = ",".join("?" * len(card_ids))
-        cur.execute(
-            f"DELETE FROM card_attempts "
-            f"WHERE card_id IN ({placeholders}) AND user_id = ?",
-            (*card_ids, effective_user_id),
-        )
 
-        # Delete cards
+def delete_subject_and_data(subject_id: int, effective_user_id: int, real_user_id: int):
+    """
+    Delete a subject and all its cards, attempts, and uploaded files for the effective user.
+    """
+    key = (subject_id, effective_user_id)
+    expiry = _missing_subjects.get(key)
+    if expiry is not None:
+        if time.monotonic() < expiry:
+            st.error("Subject not found or does not belong to this user.")
+            return
+        _missing_subjects.pop(key, None)
+
+    # One write transaction on the pooled writer; rolled back on any error
+    with pooled_connection(write=True) as conn:
+        cur = conn.cursor()
+
+        # Get subject name for logging, and whether it has any uploaded files
         cur.execute(
-            f"DELETE FROM cards WHERE id IN ({placeholders})",
-            card_ids,
+            """
+            SELECT s.name,
+                   EXISTS(SELECT 1 FROM uploaded_files f
+                          WHERE f.subject_id = s.id AND f.user_id = s.user_id)
+            FROM subjects s
+            WHERE s.id = ? AND s.user_id = ?
+            """,
+            (subject_id, effective_user_id),
         )
+        row = cur.fetchone()
+        if row is not None:
+            subj_name, has_files = row
+
+            # Delete uploaded_files rows first so we know which files to remove
+            # (skipped entirely for subjects without uploads)
+            stored_paths = []
+            if has_files:
+                stored_paths = delete_uploaded_files_returning_paths(
+                    cur,
+                    "user_id = ? AND subject_id = ?",
+                    (effective_user_id, subject_id),
+                )
+
+            # Finally delete subject; its cards and their attempts cascade
+            cur.execute(
+                "DELETE FROM subjects WHERE id = ? AND user_id = ?",
+                (subject_id, effective_user_id),
+            )
+
+    if row is None:
+        _remember_missing_subject(key)
+        st.error("Subject not found or does not belong to this user.")
+        return
 
-    # Delete uploaded_files rows and physical files
-    cur.execute(
-        "SELECT stored_path FROM uploaded_files WHERE user_id = ? AND subject_id = ?",
-        (effective_user_id, subject_id),
-    )
-    file_rows = cur.fetchall()
-    for (stored_path,) in file_rows:
-        if stored_path and os.path.exists(stored_path):
-            try:
-                os.remove(stored_path)
-            except OSError:
-                pass
-
-    cur.execute(
-        "DELETE FROM uploaded_files WHERE user_id = ? AND subject_id = ?",
-        (effective_user_id, subject_id),
-    )
-
-    # Finally delete subject
-    cur.execute(
-        "DELETE FROM subjects WHERE id = ? AND user_id = ?",
-        (subject_id, effective_user_id),
-    )
-
-    conn.commit()
-    conn.close()
+    cached_get_subjects.clear()
+    clear_file_caches()
+    clear_card_caches()
+    # Only unlink files once the delete has committed
+    remove_files(stored_paths)
 
     # Log admin action if impersonating
     if real_user_id != effective_user_id:
@@ -1,42 +1,46 @@
 # app.py
+import math
 import os
-from typing import List
+import shutil
+from functools import partial
+from html import escape
+from typing import Tuple
 
 import streamlit as st
 import pandas as pd  # used in Progress tab
 
-from models import QAItem, CardType
+from models import QAItem, CardType, SHORT_QUESTION_LEN
 from db import (
     init_db,
-    get_connection,
     load_all_cards,
-    insert_card,
     add_subject,
-    get_subjects,
+    cached_get_subjects,
     get_subject_id,
     record_attempt,
-    get_card_stats,
-    get_subject_stats,
-    update_card_schedule,
-    get_due_cards,
+    cached_subject_card_stats,
+    stats_version,
+    record_review,
+    cached_get_due_cards,
+    cached_quiz_page,
     create_user,
     get_user_by_username,
     insert_uploaded_file,
-    get_uploaded_files,
+    cached_get_uploaded_files,
+    cached_card_counts_by_file,
+    cached_subject_cards,
+    get_subject_questions,
+    cached_count_user_cards,
     delete_uploaded_file_and_cards,
-    delete_card,
+    delete_cards,
     admin_log,
     update_excluded_pages,
-    get_excluded_pages_map,
+    update_user_password,
 )
 
 from config import UPLOAD_DIR, CUSTOM_CSS
-from auth import show_auth_screen, hash_password, verify_password
+from auth import show_auth_screen, hash_password, verify_password, MIN_PASSWORD_LENGTH
 from session_utils import init_session_state, add_manual_card
 from card_generation import (
-    extract_pages_from_pdf_bytes,
-    chunk_page_text,
-    generate_cards_from_chunk,
     normalize_text,
     generate_cards_from_pdf_path,
 )
@@ -45,6 +49,302 @@ from rag_store import add_documents
 
 from admin_pages import render_admin_users  # import at top of file
 
+QUIZ_PAGE_SIZE = 200
+
+# Card templates; the styling lives once in CUSTOM_CSS (.qa-card / .qa-answer)
+_QUESTION_HTML = '<div class="qa-card"><strong>Q:</strong> {}</div>'
+_ANSWER_HTML = '<div class="qa-card qa-answer"><strong>A:</strong> {}</div>'
+FILES_PER_PAGE = 10
+
+
+def read_file_bytes(path: str) -> bytes:
+    """Contents of an uploaded file; read on download click, never cached."""
+    with open(path, "rb") as f:
+        return f.read()
+
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def card_performance_frame(
+    subject_id: int, user_id: int, version: Tuple[int, int]
+) -> pd.DataFrame:
+    """Card Performance table; `version` (db.stats_version()) keys out stale frames."""
+    # Aggregated in SQL; the remaining per-card math is vectorized
+    df = pd.DataFrame.from_records(
+        cached_subject_card_stats(subject_id, user_id, version),
+        columns=["Card ID", "Question", "Attempts", "Correct"],
+    )
+    long_q = df["Question"].str.len() > SHORT_QUESTION_LEN
+    df.loc[long_q, "Question"] = df.loc[long_q, "Question"].str[: SHORT_QUESTION_LEN - 3] + "..."
+    df["Accuracy %"] = (df["Correct"] / df["Attempts"] * 100).where(df["Attempts"] > 0)
+    return df
+
+
+def _rate_srs_card(card: QAItem, user_id: int, quality_key: str, next_index: int):
+    quality = st.session_state.get(quality_key)
+    if quality is None:
+        return
+    record_review(card.id, card.subject_id, user_id, quality)
+    st.session_state.show_answer = False
+    st.session_state.srs_index = next_index
+
+
+@st.fragment
+def _flashcards_tab(current_subject_id: int, user_id: int):
+    """Flashcards (SRS) tab body; rating a card reruns only this fragment."""
+    due_cards = cached_get_due_cards(current_subject_id, limit=100)
+
+    # Filter out multiple‑choice cards, because they already show on quiz.
+    due_cards = [c for c in due_cards if c.card_type != "multiple_choice"]
+
+    if not due_cards:
+        st.success("🎉 No cards due right now for this subject!")
+    else:
+        st.subheader("Spaced Repetition – Due Cards")
+
+        # Read session state once; this runs on every rating click
+        ss = st.session_state
+        idx = ss.get("srs_index", 0)
+        if idx >= len(due_cards):
+            idx = 0
+        ss.srs_index = idx
+        n_due = len(due_cards)
+
+        card = due_cards[idx]
+
+        st.markdown(f"**Card {idx + 1} of {n_due} due**")
+        st.markdown(_QUESTION_HTML.format(escape(card.question)), unsafe_allow_html=True)
+        st.caption(f"Type: {card.card_type}, Source: {card.source_pdf}, page {card.page}")
+
+        show = ss.get("show_answer", False)
+        if st.button("Show answer", key="show_srs_answer"):
+            ss.show_answer = show = True
+
+        if show:
+            st.markdown(_ANSWER_HTML.format(escape(card.answer)), unsafe_allow_html=True)
+
+            qualities = [0, 1, 2, 3, 4, 5]
+            labels = ["0 (Null)", "1", "2", "3 (OK)", "4 (Good)", "5 (Perfect)"]
+
+            # One radio + one submit instead of a button per quality. In a
+            # form, picking a rating doesn't rerun; the submit callback records
+            # the review before the fragment reruns, so a rating is one rerun
+            quality_key = f"srs_quality_{card.id}"
+            with st.form(f"srs_rate_{card.id}"):
+                quality = st.radio(
+                    "How well did you remember this?",
+                    qualities,
+                    index=None,
+                    format_func=labels.__getitem__,
+                    horizontal=True,
+                    key=quality_key,
+                )
+                submitted = st.form_submit_button(
+                    "Submit rating",
+                    on_click=_rate_srs_card,
+                    args=(card, user_id, quality_key, (idx + 1) % n_due),
+                )
+            if submitted and quality is None:
+                st.warning("Pick a rating first.")
+
+
+def _set_quiz_index(index: int):
+    st.session_state.quiz_index = index
+
+
+@st.fragment
+def _quiz_tab(current_subject_id: int, user_id: int):
+    """Quiz tab body; interacting with it reruns only this fragment."""
+    st.subheader("Quiz Mode")
+
+    # Fetch only the page of quiz cards containing the current question
+    q_idx = max(0, st.session_state.quiz_index)
+    page_start = q_idx - q_idx % QUIZ_PAGE_SIZE
+    n_quiz, quiz_page = cached_quiz_page(
+        current_subject_id, offset=page_start, limit=QUIZ_PAGE_SIZE
+    )
+
+    if not n_quiz:
+        st.info("No quiz questions for this subject yet.")
+    else:
+        if st.session_state.quiz_index >= n_quiz:
+            st.session_state.quiz_index = n_quiz - 1
+        if st.session_state.quiz_index < 0:
+            st.session_state.quiz_index = 0
+
+        if st.session_state.quiz_index != q_idx:
+            # Index was clamped (cards were removed); fetch its page
+            q_idx = st.session_state.quiz_index
+            page_start = q_idx - q_idx % QUIZ_PAGE_SIZE
+            n_quiz, quiz_page = cached_quiz_page(
+                current_subject_id, offset=page_start, limit=QUIZ_PAGE_SIZE
+            )
+        card = quiz_page[q_idx - page_start]
+
+        with st.container():
+            col_left, col_right = st.columns([3, 1])
+            with col_left:
+                st.markdown(
+                    f"**Question {q_idx + 1} of {n_quiz} "
+                    f"({card.card_type.replace('_', ' ').title()})**"
+                )
+            with col_right:
+                st.progress((q_idx + 1) / n_quiz)
+
+        with st.container():
+            st.markdown(_QUESTION_HTML.format(escape(card.question)), unsafe_allow_html=True)
+
+            prev_answer = st.session_state.quiz_answers.get(card.id, "")
+
+            # A form: typing an answer doesn't rerun anything, only checking does
+            with st.form(f"qform_{card.id}"):
+                if card.card_type == "multiple_choice" and card.options:
+                    default_index = 0
+                    if prev_answer in card.options:
+                        default_index = card.options.index(prev_answer)
+
+                    selected = st.radio(
+                        "Choose an option:",
+                        card.options,
+                        index=default_index,
+                        key=f"mcq_{card.id}",
+                    )
+                    user_answer = selected
+                else:
+                    user_answer = st.text_input(
+                        "Your answer:",
+                        value=prev_answer,
+                        key=f"user_answer_{card.id}",
+                    )
+                checked = st.form_submit_button("Check answer")
+
+            feedback_placeholder = st.empty()
+            if checked:
+                st.session_state.quiz_answers[card.id] = user_answer
+
+                if card.card_type == "multiple_choice" and card.options:
+                    is_correct = user_answer.strip() == card.answer_norm_cs
+                else:
+                    is_correct = user_answer.strip().lower() == card.answer_norm
+
+                # SM-2 quality: 4 when correct, 2 otherwise
+                q_quality = 4 if is_correct else 2
+                record_attempt(card.id, card.subject_id, user_id, is_correct, q_quality)
+
+                # Verdict, answer and source in one element (one delta)
+                verdict = "✅ Correct!" if is_correct else "❌ Incorrect."
+                feedback_placeholder.markdown(
+                    f"{verdict}\n\n"
+                    f"**Correct answer:** {escape(card.answer)}\n\n"
+                    f"<small>Source: {escape(card.source_pdf)}, page {card.page}</small>",
+                    unsafe_allow_html=True,
+                )
+
+            col_prev, col_next = st.columns([1, 1])
+
+            # Callbacks update the index before the fragment reruns, so no
+            # explicit (full-page) rerun is needed
+            with col_prev:
+                st.button(
+                    "⬅ Previous",
+                    disabled=(q_idx == 0),
+                    on_click=_set_quiz_index,
+                    args=(max(0, q_idx - 1),),
+                )
+
+            with col_next:
+                st.button(
+                    "Next ➡",
+                    disabled=(q_idx == n_quiz - 1),
+                    on_click=_set_quiz_index,
+                    args=(min(n_quiz - 1, q_idx + 1),),
+                )
+
+
+def _delete_cards_section(subject_id: int, user_id: int, real_user_id: int):
+    """Card deletion grid with confirmation for one subject."""
+    cards = cached_subject_cards(subject_id)
+    if not cards:
+        st.info("No cards in this subject yet.")
+        return
+
+    # One grid widget instead of a row of buttons per card; the form keeps
+    # ticking checkboxes from rerunning the tab
+    editor_key = f"del_editor_{subject_id}"
+    with st.form("delete_cards"):
+        edited = st.data_editor(
+            pd.DataFrame(
+                {
+                    "Card ID": [c.id for c in cards],
+                    "Type": [c.card_type for c in cards],
+                    "Question": [c.short_question for c in cards],
+                    "Delete": False,
+                }
+            ),
+            disabled=["Card ID", "Type", "Question"],
+            hide_index=True,
+            key=editor_key,
+        )
+        confirmed = st.checkbox("Confirm deletions", key="confirm_card_delete")
+        submitted = st.form_submit_button("Delete selected cards")
+
+    if submitted:
+        to_delete = edited.loc[edited["Delete"], "Card ID"].tolist()
+        if not to_delete:
+            st.warning("No cards selected.")
+        elif not confirmed:
+            st.warning("Tick 'Confirm deletions' to delete the selected cards.")
+        else:
+            deleted = delete_cards(to_delete, user_id)
+            if deleted:
+                st.success(f"Deleted {len(deleted)} card(s).")
+                if real_user_id != user_id:
+                    admin_log(
+                        real_user_id,
+                        user_id,
+                        f"Deleted cards {', '.join(map(str, deleted))}",
+                    )
+            if len(deleted) < len(to_delete):
+                st.error("Could not delete some cards.")
+            # Reset the grid and confirmation for the shrunken deck
+            st.session_state.pop(editor_key, None)
+            st.session_state.pop("confirm_card_delete", None)
+            st.rerun()
+
+
+@st.fragment
+def _progress_tab(user_id: int, real_user_id: int):
+    """Progress tab body; its widgets rerun only this fragment."""
+    st.subheader("📊 Learning Progress")
+
+    subject_id = st.session_state.current_subject_id
+    if subject_id is None:
+        st.info("Select a subject to see your stats.")
+    else:
+        # Subject totals are sums over the cached per-card aggregate
+        perf_df = card_performance_frame(subject_id, user_id, stats_version(subject_id))
+        total = int(perf_df["Attempts"].sum())
+        correct = int(perf_df["Correct"].sum())
+        accuracy = f"{correct / total:.1%}" if total else "0.0%"
+
+        st.metric("Total Attempts", total)
+        st.metric("Correct Answers", correct)
+        st.metric("Accuracy", accuracy)
+
+        st.markdown("### Card Performance")
+
+        st.dataframe(perf_df)
+
+        # Card deletion UI; the grid is only built while the expander is open
+        deleter = st.expander(
+            "Delete individual cards",
+            expanded=False,
+            key="delete_cards_expander",
+            on_change="rerun",
+        )
+        with deleter:
+            if deleter.open:
+                _delete_cards_section(subject_id, user_id, real_user_id)
+
 
 def main():
     init_db()
@@ -56,7 +356,10 @@ def main():
 
     real_user_id = st.session_state["real_user_id"]
     effective_user_id = st.session_state["effective_user_id"]
-    real_username = st.session_state.get("real_username", get_username_by_id(real_user_id))
+    real_username = st.session_state.get("real_username") or get_username_by_id(real_user_id)
+    # Looked up once per run; only differs while impersonating
+    impersonating = real_user_id != effective_user_id
+    effective_username = get_username_by_id(effective_user_id) if impersonating else real_username
 
     st.set_page_config(page_title="AI Learning Assistant", layout="wide")
     st.markdown(CUSTOM_CSS, unsafe_allow_html=True)
@@ -64,8 +367,7 @@ def main():
 
 
     # Warning banner when impersonating
-    if real_user_id != effective_user_id:
-        effective_username = get_username_by_id(effective_user_id)
+    if impersonating:
         st.warning(
             f"Admin impersonation active: you are logged in as **{real_username}** "
             f"but currently acting as **{effective_username}** (user ID {effective_user_id})."
@@ -84,8 +386,7 @@ def main():
         st.markdown("### 👤 Account")
         st.write(f"Signed in as **{real_username}**")
 
-        if real_user_id != effective_user_id:
-            effective_username = get_username_by_id(effective_user_id)
+        if impersonating:
             st.info(f"Impersonating **{effective_username}**")
 
         if st.button("Log out"):
@@ -96,27 +397,25 @@ def main():
         st.markdown("---")
 
         # -------------------- PROFILE SETTINGS (Change Password) --------------------
-        with st.expander("🔐 Profile Settings (Change Password)", expanded=False):
+        with st.expander("🔐 Profile Settings (Change Password)", expanded=False), st.form("pw_form"):
+            # A form: typing doesn't rerun the script, only submitting does
             old_pw = st.text_input("Current password", type="password", key="prof_old_pw")
             new_pw = st.text_input("New password", type="password", key="prof_new_pw")
             new_pw2 = st.text_input("Confirm new password", type="password", key="prof_new_pw2")
 
-            if st.button("Update Password"):
-                user = get_user_by_username(real_username)
-                if not user or not verify_password(old_pw, user[2]):
-                    st.error("Incorrect current password.")
-                elif new_pw != new_pw2:
+            if st.form_submit_button("Update Password"):
+                # Cheap checks first; bcrypt verification is deliberately slow
+                if new_pw != new_pw2:
                     st.error("New passwords do not match.")
-                elif len(new_pw) < 6:
-                    st.error("Password must be at least 6 characters.")
+                elif len(new_pw) < MIN_PASSWORD_LENGTH:
+                    st.error(f"Password must be at least {MIN_PASSWORD_LENGTH} characters.")
                 else:
-                    pw_hash = hash_password(new_pw)
-                    conn = get_connection()
-                    cur = conn.cursor()
-                    cur.execute("UPDATE users SET password_hash=? WHERE id=?", (pw_hash, real_user_id))
-                    conn.commit()
-                    conn.close()
-                    st.success("Password updated!")
+                    user = get_user_by_username(real_username)
+                    if not user or not verify_password(old_pw, user[2]):
+                        st.error("Incorrect current password.")
+                    else:
+                        update_user_password(real_user_id, hash_password(new_pw))
+                        st.success("Password updated!")
 
         st.markdown("---")
 
@@ -128,7 +427,7 @@ def main():
             st.markdown("---")
         # --------------------- SUBJECTS — MAIN SECTION ----------------------
         with st.expander("📚 Subjects (Select or Create)", expanded=True):
-            subjects = get_subjects(effective_user_id)
+            subjects = cached_get_subjects(effective_user_id)
             subject_names = [name for (_, name) in subjects]
             options = ["(Select subject)"] + subject_names + ["(Create new subject…)"]
             selected = st.selectbox("Current subject", options)
@@ -172,7 +471,7 @@ def main():
         st.markdown("---")
 
         # -------------------- MANUAL CARDS — COLLAPSIBLE --------------------
-        with st.expander("✍️ Add Manual Flashcards", expanded=False):
+        with st.expander("✍️ Add Manual Flashcards", expanded=False), st.form("manual_card"):
             manual_q = st.text_area("Question")
             manual_a = st.text_area("Answer")
             manual_type = st.selectbox(
@@ -181,7 +480,7 @@ def main():
                 index=0,
             )
 
-            if st.button("Add manual card"):
+            if st.form_submit_button("Add manual card"):
                 if manual_q.strip() and manual_a.strip():
                     add_manual_card(
                         card_type=manual_type,
@@ -194,7 +493,7 @@ def main():
                     st.warning("Please provide both a question and an answer.")
 
         st.markdown("---")
-        st.info(f"Total cards: **{len(st.session_state.deck)}**")
+        st.info(f"Total cards: **{cached_count_user_cards(effective_user_id)}**")
     # === ROUTER: decide what to render ===
     view = st.session_state.get("view", "main")
 
@@ -246,57 +545,59 @@ def main():
 
         # If user selected files, show a pre-generation "exclude pages" UI per file
         if uploaded_files:
-            st.write("Files selected:")
-            for f in uploaded_files:
-                st.write(f"- {f.name}")
-
-                # Use TWO KEYS to avoid Streamlit error:
-                # - ui_key: widget's key
-                # - logic_key: your own state for business logic
-                ui_key = f"ui_exclude_pages_{f.name}"
-                logic_key = f"exclude_pre_{f.name}"
-
-                # The widget manages ui_key internally; we read its value and copy to logic_key
-                val = st.text_input(
-                    f"Exclude pages BEFORE generation for {f.name} (e.g. 1,2,5-7)",
-                    value=st.session_state.get(logic_key, ""),
-                    key=ui_key
+            # Exclusions are submitted together with the generate button
+            with st.form("excl_pre"):
+                st.write("Files selected:")
+                for f in uploaded_files:
+                    st.write(f"- {f.name}")
+
+                    # Use TWO KEYS to avoid Streamlit error:
+                    # - ui_key: widget's key
+                    # - logic_key: your own state for business logic
+                    ui_key = f"ui_exclude_pages_{f.name}"
+                    logic_key = f"exclude_pre_{f.name}"
+
+                    # The widget manages ui_key internally; we read its value and copy to logic_key
+                    val = st.text_input(
+                        f"Exclude pages BEFORE generation for {f.name} (e.g. 1,2,5-7)",
+                        value=st.session_state.get(logic_key, ""),
+                        key=ui_key
+                    )
+                    # Store separately (safe because logic_key != ui_key)
+                    st.session_state[logic_key] = val
+
+                # Generation button
+                generate_clicked = st.form_submit_button(
+                    "🚀 Generate flashcards & quizzes from PDFs", key="btn_generate_from_uploads"
                 )
-                # Store separately (safe because logic_key != ui_key)
-                st.session_state[logic_key] = val
 
-            # Generation button
-            if st.button("🚀 Generate flashcards & quizzes from PDFs", key="btn_generate_from_uploads"):
+            if generate_clicked:
                 subject_id = st.session_state.get("current_subject_id")
                 if subject_id is None:
                     st.error("You must select a subject before generating cards.")
                 else:
                     max_cards = st.session_state.get("max_cards", 50)
                     with st.spinner(f"Reading PDFs and generating up to {max_cards} cards..."):
-                        deck: List[QAItem] = st.session_state.deck
-                        current_id = max((c.id for c in deck), default=0) + 1
                         new_cards_count = 0
 
                         # Existing normalized questions for this subject (for dedup)
-                        existing_norm_questions = [
-                            normalize_text(c.question)
-                            for c in deck
-                            if c.subject_id == subject_id
-                        ]
+                        existing_norm_questions = {
+                            normalize_text(q) for q in get_subject_questions(subject_id)
+                        }
 
                         for file in uploaded_files:
                             if new_cards_count >= max_cards:
                                 break
 
                             pdf_name = file.name
-                            file_bytes = file.read()
 
-                            # 1) Save PDF to disk
+                            # 1) Save PDF to disk, copying in 1 MiB blocks
                             user_folder = UPLOAD_DIR / f"user_{user_id}" / f"subject_{subject_id}"
                             user_folder.mkdir(parents=True, exist_ok=True)
                             stored_path = user_folder / pdf_name
+                            file.seek(0)
                             with open(stored_path, "wb") as f_out:
-                                f_out.write(file_bytes)
+                                shutil.copyfileobj(file, f_out, length=1 << 20)
 
                             # 2) Insert metadata FIRST so we get file_id
                             file_id = insert_uploaded_file(
@@ -313,59 +614,26 @@ def main():
                                 # Save in DB; your DB layer parses and stores ranges
                                 update_excluded_pages(file_id, user_excluded_text)
 
-                            # 4) Load excluded pages map (int set) for this file_id
-                            excluded_pages = get_excluded_pages_map(file_id)
-
-                            # 5) Extract pages and generate cards while skipping excluded ones
-                            pages = extract_pages_from_pdf_bytes(file_bytes)
+                            # 4) Extract pages from disk and generate cards, skipping
+                            #    excluded pages
                             rag_chunks = []
-                            for page_info in pages:
-                                if new_cards_count >= max_cards:
-                                    break
-
-                                page_number = page_info["page"]
-
-                                # Skip excluded pages
-                                if page_number in excluded_pages:
-                                    continue
-
-                                text = page_info["text"]
-                                if not text.strip():
-                                    continue
-
-                                # Split into chunks and collect for RAG
-                                chunks = chunk_page_text(text)
-                                rag_chunks.extend(chunks)
-
-                                # Generate cards per chunk (respecting budget)
-                                for chunk in chunks:
-                                    if new_cards_count >= max_cards:
-                                        break
-                                    per_chunk_limit = min(7, max_cards - new_cards_count)
-                                    new_items = generate_cards_from_chunk(
-                                        chunk_text=chunk,
-                                        page=page_number,
-                                        source_pdf=pdf_name,
-                                        subject_id=subject_id,
-                                        starting_id=current_id,
-                                        max_items_for_this_chunk=per_chunk_limit,
-                                        existing_norm_questions=existing_norm_questions,
-                                    )
-
-                                    # Persist cards
-                                    for card in new_items:
-                                        insert_card(card)
-                                        deck.append(card)
-                                    new_cards_count += len(new_items)
-                                    current_id += len(new_items)
-
-                            # 6) Index allowed chunks in RAG (after filtering)
+                            new_cards_count += generate_cards_from_pdf_path(
+                                pdf_path=str(stored_path),
+                                pdf_name=pdf_name,
+                                subject_id=subject_id,
+                                max_new_cards=max_cards - new_cards_count,
+                                file_id=file_id,
+                                existing_norm_questions=existing_norm_questions,
+                                rag_chunks=rag_chunks,
+                            )
+
+                            # 5) Index allowed chunks in RAG (after filtering)
                             if rag_chunks:
                                 add_documents(user_id, subject_id, rag_chunks)
 
                         st.success(
                             f"Generation complete! Added {new_cards_count} new cards. "
-                            f"Your deck now has {len(st.session_state.deck)} cards."
+                            f"Your deck now has {cached_count_user_cards(user_id)} cards."
                         )
 
                         # Impersonation log if applicable
@@ -385,7 +653,7 @@ def main():
         else:
             st.subheader("Uploaded PDFs for this subject")
 
-            files = get_uploaded_files(user_id, current_subject_id)
+            files = cached_get_uploaded_files(user_id, current_subject_id)
 
             if not files:
                 st.info("No files uploaded yet for this subject.")
@@ -399,7 +667,26 @@ def main():
                     key="manage_max_new_cards_per_file"
                 )
 
-                for fmeta in files:
+                # Only render one page of files (each row is several widgets)
+                n_file_pages = math.ceil(len(files) / FILES_PER_PAGE)
+                if n_file_pages > 1:
+                    file_page = st.number_input(
+                        "Page",
+                        min_value=1,
+                        max_value=n_file_pages,
+                        value=1,
+                        step=1,
+                        key="files_page",
+                    )
+                    st.caption(f"Page {file_page} of {n_file_pages} ({len(files)} files)")
+                else:
+                    file_page = 1
+                page_files = files[(file_page - 1) * FILES_PER_PAGE : file_page * FILES_PER_PAGE]
+
+                # Card counts per source PDF, one grouped query instead of per file
+                card_counts = cached_card_counts_by_file(current_subject_id)
+
+                for fmeta in page_files:
                     file_id = fmeta["id"]
                     filename = fmeta["filename"]
                     stored_path = fmeta["stored_path"]
@@ -413,12 +700,7 @@ def main():
 
                     # ----- CARD COUNT FOR THIS FILE -----
                     with col2:
-                        count = sum(
-                            1 for c in st.session_state.deck
-                            if c.subject_id == current_subject_id
-                            and c.source_pdf == filename
-                        )
-                        st.write(f"Cards: {count}")
+                        st.write(f"Cards: {card_counts.get(filename, 0)}")
 
                     # ----- EXCLUDED PAGES UI (safe dual-key pattern) -----
                     with col3:
@@ -451,51 +733,31 @@ def main():
 
                     with col4:
                         if st.button("Generate more questions", key=f"regen_more_{file_id}"):
-                            # 1. Load PDF bytes
-                            try:
-                                with open(stored_path, "rb") as pdf_file:
-                                    file_bytes = pdf_file.read()
-                            except FileNotFoundError:
+                            # 1. Check the PDF is still on disk (it is read lazily below)
+                            if not os.path.isfile(stored_path):
                                 st.error("PDF file not found on disk.")
                                 continue
 
-                            # 2. Parse exclusions (from DB)
-                            excluded_pages = get_excluded_pages_map(file_id)
-
-                            # 3. Extract + chunk text, skipping excluded pages
-                            pages = extract_pages_from_pdf_bytes(file_bytes)
-                            all_chunks = []
-
-                            for page_info in pages:
-                                page_num = page_info["page"]
-
-                                if page_num in excluded_pages:
-                                    continue
-
-                                text = page_info["text"]
-                                if not text.strip():
-                                    continue
-
-                                chunks = chunk_page_text(text)
-                                all_chunks.extend(chunks)
-
-                            # 4. Add chunks to RAG
-                            if all_chunks:
-                                add_documents(
-                                    user_id=user_id,
-                                    subject_id=current_subject_id,
-                                    docs=all_chunks
-                                )
-
-                            # 5. Generate new cards (your existing utility)
+                            # 2. Generate new cards in one pass over the PDF, skipping
+                            #    excluded pages, and collect all its chunks for RAG
+                            rag_chunks = []
                             added = generate_cards_from_pdf_path(
                                 pdf_path=stored_path,
                                 pdf_name=filename,
                                 subject_id=current_subject_id,
                                 max_new_cards=max_new_cards,
-                                file_id=file_id
+                                file_id=file_id,
+                                rag_chunks=rag_chunks,
                             )
 
+                            # 3. Add chunks to RAG
+                            if rag_chunks:
+                                add_documents(
+                                    user_id=user_id,
+                                    subject_id=current_subject_id,
+                                    docs=rag_chunks
+                                )
+
                             st.success(f"Added {added} new cards from {filename}.")
 
                             if real_user_id != user_id:
@@ -509,17 +771,17 @@ def main():
 
                     # ----- DOWNLOAD PDF BUTTON -----
                     with col5:
-                        try:
-                            with open(stored_path, "rb") as f_in:
-                                st.download_button(
-                                    "Download",
-                                    data=f_in,
-                                    file_name=filename,
-                                    mime="application/pdf",
-                                    key=f"dl_file_{file_id}",
-                                )
-                        except FileNotFoundError:
+                        if not os.path.isfile(stored_path):
                             st.error("File missing on disk.")
+                        else:
+                            # Bytes are only read when the button is clicked
+                            st.download_button(
+                                "Download",
+                                data=partial(read_file_bytes, stored_path),
+                                file_name=filename,
+                                mime="application/pdf",
+                                key=f"dl_file_{file_id}",
+                            )
 
                     # ----- DELETE PDF AND ITS CARDS -----
                     with col5:
@@ -538,9 +800,11 @@ def main():
                                     deleted_path = delete_uploaded_file_and_cards(file_id, user_id)
 
                                     # Remove from disk
-                                    if deleted_path and os.path.exists(deleted_path):
+                                    if deleted_path:
                                         try:
-                                            os.remove(deleted_path)
+                                            os.unlink(deleted_path)
+                                        except FileNotFoundError:
+                                            pass
                                         except OSError:
                                             st.warning("Metadata deleted but file could not be removed.")
 
@@ -563,7 +827,7 @@ def main():
     # ------------------------- Study Area -------------------------
     st.header("🎯 Study Area")
 
-    if not st.session_state.deck:
+    if not cached_count_user_cards(user_id):
         st.info("No cards yet. Upload PDFs and/or add manual cards to start studying.")
         return
 
@@ -572,238 +836,24 @@ def main():
         st.warning("Select a subject to study its cards.")
         return
 
-    tab_flashcards, tab_quiz, tab_progress = st.tabs(["Flashcards", "Quiz", "Progress"])
+    # Tabs track their state so hidden ones can skip their work
+    tab_flashcards, tab_quiz, tab_progress = st.tabs(
+        ["Flashcards", "Quiz", "Progress"], key="study_tabs", on_change="rerun"
+    )
 
     # ---------- Flashcards Tab (SRS) ----------
     with tab_flashcards:
-        due_cards = get_due_cards(current_subject_id, limit=100)
-
-        # Filter out multiple‑choice cards, because they already show on quiz.
-        due_cards = [c for c in due_cards if c.card_type != "multiple_choice"]
-
-        if not due_cards:
-            st.success("🎉 No cards due right now for this subject!")
-        else:
-            st.subheader("Spaced Repetition – Due Cards")
-
-            if "srs_index" not in st.session_state:
-                st.session_state.srs_index = 0
-
-            idx = st.session_state.srs_index
-            if idx >= len(due_cards):
-                st.session_state.srs_index = 0
-                idx = 0
-
-            card = due_cards[idx]
-
-            st.markdown(f"**Card {idx + 1} of {len(due_cards)} due**")
-            st.markdown(
-                f"""
-                <div style="border:1px solid #ccc; padding:1rem; border-radius:0.5rem;">
-                <strong>Q:</strong> {card.question}
-                </div>
-                """,
-                unsafe_allow_html=True,
-            )
-            st.caption(f"Type: {card.card_type}, Source: {card.source_pdf}, page {card.page}")
-
-            if st.button("Show answer", key="show_srs_answer"):
-                st.session_state.show_answer = True
-
-            if st.session_state.show_answer:
-                st.markdown(
-                    f"""
-                    <div style="border:1px solid #ccc; padding:1rem; border-radius:0.5rem; background:#f8f8f8;">
-                    <strong>A:</strong> {card.answer}
-                    </div>
-                    """,
-                    unsafe_allow_html=True,
-                )
-
-                st.markdown("### How well did you remember this?")
-                cols = st.columns(6)
-                qualities = [0, 1, 2, 3, 4, 5]
-                labels = ["0 (Null)", "1", "2", "3 (OK)", "4 (Good)", "5 (Perfect)"]
-
-                for col, q, label in zip(cols, qualities, labels):
-                    with col:
-                        if st.button(label, key=f"quality_{card.id}_{q}"):
-                            is_correct = q >= 3
-                            record_attempt(card.id, card.subject_id, user_id, is_correct, q)
-                            update_card_schedule(card.id, q)
-                            st.session_state.show_answer = False
-                            st.session_state.srs_index = (idx + 1) % len(due_cards)
-                            st.experimental_rerun() if hasattr(st, "experimental_rerun") else st.rerun()
+        _flashcards_tab(current_subject_id, user_id)
 
     # ---------- Quiz Tab (one question at a time) ----------
     with tab_quiz:
-        st.subheader("Quiz Mode")
-
-        quiz_items = [
-            c
-            for c in st.session_state.deck
-            if c.card_type in ("short_answer", "fill_in_blank", "multiple_choice")
-            and c.subject_id == current_subject_id
-        ]
-
-        if not quiz_items:
-            st.info("No quiz questions for this subject yet.")
-        else:
-            if st.session_state.quiz_index >= len(quiz_items):
-                st.session_state.quiz_index = len(quiz_items) - 1
-            if st.session_state.quiz_index < 0:
-                st.session_state.quiz_index = 0
-
-            q_idx = st.session_state.quiz_index
-            card = quiz_items[q_idx]
-
-            with st.container():
-                col_left, col_right = st.columns([3, 1])
-                with col_left:
-                    st.markdown(
-                        f"**Question {q_idx + 1} of {len(quiz_items)} "
-                        f"({card.card_type.replace('_', ' ').title()})**"
-                    )
-                with col_right:
-                    st.progress((q_idx + 1) / len(quiz_items))
-
-            with st.container():
-                st.markdown(
-                    f"""
-                    <div style="border:1px solid #ccc; padding:1rem; border-radius:0.5rem;">
-                    <strong>Q:</strong> {card.question}
-                    </div>
-                    """,
-                    unsafe_allow_html=True,
-                )
-
-                prev_answer = st.session_state.quiz_answers.get(card.id, "")
-
-                if card.card_type == "multiple_choice" and card.options:
-                    default_index = 0
-                    if prev_answer in card.options:
-                        default_index = card.options.index(prev_answer)
-
-                    selected = st.radio(
-                        "Choose an option:",
-                        card.options,
-                        index=default_index,
-                        key=f"mcq_{card.id}",
-                    )
-                    user_answer = selected
-                else:
-                    user_answer = st.text_input(
-                        "Your answer:",
-                        value=prev_answer,
-                        key=f"user_answer_{card.id}",
-                    )
-
-                col_prev, col_check, col_next = st.columns([1, 1, 1])
-                feedback_placeholder = st.empty()
-
-                with col_check:
-                    if st.button("Check answer", key=f"check_{card.id}"):
-                        st.session_state.quiz_answers[card.id] = user_answer
-
-                        if card.card_type == "multiple_choice" and card.options:
-                            is_correct = user_answer.strip() == card.answer.strip()
-                        else:
-                            is_correct = user_answer.strip().lower() == card.answer.strip().lower()
-
-                        q_quality = 4 if is_correct else 2
-                        record_attempt(card.id, card.subject_id, user_id, is_correct, q_quality)
-
-                        if is_correct:
-                            feedback_placeholder.success("✅ Correct!")
-                        else:
-                            feedback_placeholder.error("❌ Incorrect.")
-
-                        feedback_placeholder.markdown(f"**Correct answer:** {card.answer}")
-                        st.caption(f"Source: {card.source_pdf}, page {card.page}")
-
-                with col_prev:
-                    if st.button("⬅ Previous", disabled=(q_idx == 0)):
-                        st.session_state.quiz_index = max(0, q_idx - 1)
-                        st.experimental_rerun() if hasattr(st, "experimental_rerun") else st.rerun()
-
-                with col_next:
-                    if st.button("Next ➡", disabled=(q_idx == len(quiz_items) - 1)):
-                        st.session_state.quiz_index = min(len(quiz_items) - 1, q_idx + 1)
-                        st.experimental_rerun() if hasattr(st, "experimental_rerun") else st.rerun()
+        _quiz_tab(current_subject_id, user_id)
 
     # ---------- Progress Tab ----------
+    # Only computed while selected; stats queries and the frame are skipped otherwise
     with tab_progress:
-        st.subheader("📊 Learning Progress")
-
-        subject_id = st.session_state.current_subject_id
-        if subject_id is None:
-            st.info("Select a subject to see your stats.")
-        else:
-            total, correct = get_subject_stats(subject_id, user_id)
-            accuracy = (correct / total * 100) if total > 0 else 0
-
-            st.metric("Total Attempts", total)
-            st.metric("Correct Answers", correct)
-            st.metric("Accuracy", f"{accuracy:.1f}%")
-
-            st.markdown("### Card Performance")
-
-            rows = []
-            for c in st.session_state.deck:
-                if c.subject_id == subject_id:
-                    t, a = get_card_stats(c.id, user_id)
-                    acc = (a / t * 100) if t > 0 else None
-                    rows.append(
-                        {
-                            "Card ID": c.id,
-                            "Question": c.question[:80] + "...",
-                            "Attempts": t,
-                            "Correct": a,
-                            "Accuracy %": acc,
-                        }
-                    )
-
-            df = pd.DataFrame(rows)
-            st.dataframe(df)
-
-            # Card deletion UI with confirmation
-            st.markdown("### Delete individual cards")
-            for c in st.session_state.deck:
-                if c.subject_id != subject_id:
-                    continue
-
-                col_q, col_btn = st.columns([5, 1])
-                with col_q:
-                    st.write(f"#{c.id} [{c.card_type}] {c.question[:80]}...")
-                with col_btn:
-                    delete_key = f"del_card_{c.id}"
-                    confirm_key = f"confirm_card_{c.id}"
-
-                    if st.button("Delete", key=delete_key):
-                        st.session_state[confirm_key] = True
-
-                    if st.session_state.get(confirm_key):
-                        st.warning(f"Delete card #{c.id}?")
-                        col_y, col_n = st.columns(2)
-
-                        with col_y:
-                            if st.button("Yes, delete", key=f"yes_{delete_key}"):
-                                ok = delete_card(c.id, user_id)
-                                if ok:
-                                    st.session_state.deck = [d for d in st.session_state.deck if d.id != c.id]
-                                    st.success(f"Card {c.id} deleted.")
-                                    if real_user_id != user_id:
-                                        admin_log(real_user_id, user_id, f"Deleted card {c.id}")
-                                else:
-                                    st.error("Could not delete card.")
-                                st.session_state.pop(confirm_key, None)
-                                st.experimental_rerun() if hasattr(st, "experimental_rerun") else st.rerun()
-
-                        with col_n:
-                            if st.button("Cancel", key=f"cancel_{delete_key}"):
-                                st.session_state.pop(confirm_key, None)
-                                st.experimental_rerun() if hasattr(st, "experimental_rerun") else st.rerun()
-
+        if tab_progress.open:
+            _progress_tab(user_id, real_user_id)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,15 +1,20 @@
 # card_generation.py
 import json
+import multiprocessing
+import os
 import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from difflib import SequenceMatcher
-from typing import List
+from functools import lru_cache
+from typing import FrozenSet, Iterable, Iterator, List, Set, Tuple
 
-import fitz  # PyMuPDF
 import streamlit as st
 
 import llm_client as llm
 from models import QAItem
-from db import insert_card, get_excluded_pages_map
+from pdf_extract import PdfSource, extract_page_range, open_pdf
+from db import cached_get_excluded_pages_map, get_subject_questions, insert_cards_bulk
 
 from rag_store import retrieve
 
@@ -17,14 +22,18 @@ from rag_store import retrieve
 # Helpers for deduplication
 # =========================
 
+# Memoized: every Generate click re-normalizes the subject's existing questions,
+# which are the same strings from one run to the next
+@lru_cache(maxsize=16384)
 def normalize_text(s: str) -> str:
     """Normalize text for deduplication: lowercase, trim, collapse internal spaces."""
-    return re.sub(r"\s+", " ", s.strip().lower())
+    # split() with no separator trims and collapses whitespace runs in C
+    return " ".join(s.lower().split())
 
 
 def is_similar_to_existing(
     norm_question: str,
-    existing_norm_questions: List[str],
+    existing_norm_questions: Iterable[str],
     threshold: float = 0.85,
 ) -> bool:
     """
@@ -32,8 +41,21 @@ def is_similar_to_existing(
     Uses difflib.SequenceMatcher for approximate similarity.
     threshold in [0, 1]; higher = stricter dedup.
     """
+    # Exact duplicates: O(1) when given a set
+    if norm_question in existing_norm_questions:
+        return True
+
+    # ratio() is not symmetric, so keep the original argument order
+    # (candidate as a, existing question as b) and only run the full ratio()
+    # when the cheap upper bounds allow a match.
+    matcher = SequenceMatcher(None, a=norm_question)
     for q in existing_norm_questions:
-        if SequenceMatcher(None, norm_question, q).ratio() >= threshold:
+        matcher.set_seq2(q)
+        if (
+            matcher.real_quick_ratio() >= threshold
+            and matcher.quick_ratio() >= threshold
+            and matcher.ratio() >= threshold
+        ):
             return True
     return False
 
@@ -68,6 +90,15 @@ Rules:
 """
 
 
+# All metadata phrases in one alternation: a single scan of the question
+# instead of one substring search per phrase
+_METADATA_Q_RE = re.compile(
+    r"page number|which page|on what page|page |section |chapter |figure |table "
+    r"|title of th(?:e|is)|name of th(?:e|is) article|document title|heading"
+)
+_TITLE_WORD_RE = re.compile(r"title|name|heading")
+
+
 def is_metadata_question(question: str, answer: str) -> bool:
     """
     Heuristically filter out questions that are about page numbers, titles,
@@ -76,57 +107,26 @@ def is_metadata_question(question: str, answer: str) -> bool:
     q = question.lower()
     a = answer.lower()
 
-    forbidden_in_q = [
-        "page number",
-        "which page",
-        "on what page",
-        "page ",
-        "section ",
-        "chapter ",
-        "figure ",
-        "table ",
-        "title of the",
-        "title of this",
-        "name of the article",
-        "name of this article",
-        "document title",
-        "heading",
-        "subheading",
-    ]
-    if any(k in q for k in forbidden_in_q):
+    if _METADATA_Q_RE.search(q):
         return True
 
-    if a.startswith("page "):
-        return True
-    if a.startswith("p.") or a.startswith("pg."):
+    if a.startswith(("page ", "p.", "pg.")):
         return True
     if a.strip().isdigit():
         return True
-    if len(a.split()) <= 3 and any(word in q for word in ["title", "name", "heading"]):
+    if len(a.split()) <= 3 and _TITLE_WORD_RE.search(q):
         return True
 
     return False
 
 
-def generate_cards_from_chunk(
+def _build_prompt(
     chunk_text: str,
     page: int,
     source_pdf: str,
     subject_id: int,
-    starting_id: int = 1,
-    max_items_for_this_chunk: int = 7,
-    existing_norm_questions: List[str] = None,
-) -> List[QAItem]:
-    """
-    Calls the LLM to generate cards from a chunk of text.
-    Returns a list of QAItem with subject_id filled in.
-
-    existing_norm_questions: list of normalized question texts for this subject,
-    used to avoid duplicates / near-duplicates.
-    """
-    if existing_norm_questions is None:
-        existing_norm_questions = []
-
+    max_items_for_this_chunk: int,
+) -> str:
     # NEW: retrieve relevant context from vector DB
     retrieved_context = retrieve(subject_id=subject_id,
                                  user_id=st.session_state.effective_user_id,
@@ -166,10 +166,17 @@ Rules:
 
 Return only JSON in the schema specified.
 """
+    return SYSTEM_PROMPT + "\n" + user_prompt
 
-    response = llm.ask_question(SYSTEM_PROMPT + "\n" + user_prompt)
-    content = response
 
+def _parse_cards(
+    content: str,
+    page: int,
+    source_pdf: str,
+    subject_id: int,
+    starting_id: int,
+    existing_norm_questions: Set[str],
+) -> List[QAItem]:
     try:
         data = json.loads(content)
     except json.JSONDecodeError as e:
@@ -220,7 +227,74 @@ Return only JSON in the schema specified.
         )
         items.append(qa)
         idx += 1
-        existing_norm_questions.append(norm_q)
+        existing_norm_questions.add(norm_q)
+
+    return items
+
+
+# LLM requests are network-bound, so a few can be in flight at once.
+LLM_CONCURRENCY = 4
+_LLM_POOL = ThreadPoolExecutor(max_workers=LLM_CONCURRENCY, thread_name_prefix="llm")
+
+
+def generate_cards_from_chunks(
+    chunks: Iterable[Tuple[str, int]],
+    source_pdf: str,
+    subject_id: int,
+    max_items: int = 7,
+    existing_norm_questions: Set[str] = None,
+) -> List[QAItem]:
+    """
+    Calls the LLM to generate up to max_items cards from a stream of
+    (chunk_text, page) pairs. Up to LLM_CONCURRENCY requests are kept in
+    flight while earlier responses are parsed; parsing stays in chunk order
+    so dedup matches a serial run. Requests never ask for more cards than the
+    budget left after pending ones, and chunks stop being pulled once
+    max_items cards have been produced. Cards carry id 0 until
+    insert_card/insert_cards_bulk assign their database ids.
+
+    existing_norm_questions: set of normalized question texts for this subject,
+    used to avoid duplicates / near-duplicates. Accepted questions are added
+    to it, so later chunks in the same run see them.
+    """
+    if max_items <= 0:
+        return []
+    if existing_norm_questions is None:
+        existing_norm_questions = set()
+
+    items: List[QAItem] = []
+    in_flight = deque()
+    # Cards asked for by requests still in flight; counted against the budget
+    # so no request is sent for cards that pending ones may already cover
+    outstanding = 0
+
+    def collect_oldest():
+        nonlocal outstanding
+        page, requested, fut = in_flight.popleft()
+        outstanding -= requested
+        new_items = _parse_cards(
+            fut.result(), page, source_pdf, subject_id,
+            0, existing_norm_questions,
+        )
+        items.extend(new_items[: max_items - len(items)])
+
+    for chunk_text, page in chunks:
+        while in_flight and (
+            len(in_flight) >= LLM_CONCURRENCY
+            or len(items) + outstanding >= max_items
+        ):
+            collect_oldest()
+        if len(items) >= max_items:
+            break
+        per_chunk_limit = min(7, max_items - len(items) - outstanding)
+        prompt = _build_prompt(chunk_text, page, source_pdf, subject_id, per_chunk_limit)
+        in_flight.append((page, per_chunk_limit, _LLM_POOL.submit(llm.ask_question, prompt)))
+        outstanding += per_chunk_limit
+
+    while in_flight and len(items) < max_items:
+        collect_oldest()
+    for _, _, fut in in_flight:
+        fut.cancel()
 
     return items
 
@@ -229,66 +303,103 @@ Return only JSON in the schema specified.
 # PDF handling & text chunking
 # =========================
 
-def extract_pages_from_pdf_bytes(file_bytes: bytes) -> List[dict]:
-    doc = fitz.open(stream=file_bytes, filetype="pdf")
-    pages = []
-    for i, page in enumerate(doc, start=1):
-        text = page.get_text()
-        pages.append({"page": i, "text": text})
+# Below this many pages, shipping the PDF to worker processes costs more
+# than extracting it in-process.
+_PARALLEL_MIN_PAGES = 32
+_PAGES_PER_TASK = 16
+
+
+@st.cache_resource
+def _extraction_pool() -> ProcessPoolExecutor:
+    # spawn: forking a multi-threaded Streamlit server is unsafe
+    return ProcessPoolExecutor(
+        max_workers=os.cpu_count() or 1,
+        mp_context=multiprocessing.get_context("spawn"),
+    )
+
+
+def _iter_pages(source: PdfSource) -> Iterator[dict]:
+    """
+    Yield {"page", "text"} dicts in page order. Large PDFs are split into page
+    ranges extracted in parallel worker processes, so callers can start
+    chunking the first pages while later ranges are still being extracted.
+    """
+    doc = open_pdf(source)
+    page_count = doc.page_count
+    if page_count < _PARALLEL_MIN_PAGES or (os.cpu_count() or 1) < 2:
+        try:
+            for i, page in enumerate(doc, start=1):
+                yield {"page": i, "text": page.get_text()}
+        finally:
+            doc.close()
+        return
     doc.close()
-    return pages
 
+    # Keep only a bounded window of ranges in flight, so extracted text can't
+    # pile up ahead of a slow consumer (peak memory ~ window, not whole PDF)
+    pool = _extraction_pool()
+    window = 2 * (os.cpu_count() or 1)
+    starts = iter(range(0, page_count, _PAGES_PER_TASK))
+    futures = deque()
+
+    def submit_next():
+        start = next(starts, None)
+        if start is not None:
+            futures.append(pool.submit(
+                extract_page_range, source, start, min(start + _PAGES_PER_TASK, page_count)
+            ))
+
+    for _ in range(window):
+        submit_next()
+    try:
+        while futures:
+            pages = futures.popleft().result()
+            submit_next()
+            yield from pages
+    finally:
+        # Caller may stop early (e.g. max cards reached)
+        for fut in futures:
+            fut.cancel()
+
+
+def iter_pages_from_pdf_path(pdf_path: str) -> Iterator[dict]:
+    """Yield a stored PDF's pages lazily (workers get the path, not the bytes)."""
+    return _iter_pages(str(pdf_path))
 
-def chunk_page_text(page_text: str, max_chars: int = 1200) -> List[str]:
-    paragraphs = [p.strip() for p in page_text.split("\n") if p.strip()]
-    chunks = []
+
+def chunk_page_text(page_text: str, max_chars: int = 1200) -> Iterator[str]:
+    """
+    Yield the page's paragraphs packed into chunks of at most max_chars.
+    Lazy, so a caller that runs out of card budget stops chunking mid-page.
+    """
     current = ""
 
-    for p in paragraphs:
+    for line in page_text.split("\n"):
+        p = line.strip()
+        if not p:
+            continue
         if len(current) + len(p) + 1 <= max_chars:
             current += (" " if current else "") + p
         else:
             if current:
-                chunks.append(current)
+                yield current
             current = p
 
     if current:
-        chunks.append(current)
-
-    return chunks
+        yield current
 
 
-def generate_cards_from_pdf_path(
-    pdf_path: str,
-    pdf_name: str,
-    subject_id: int,
-    max_new_cards: int,
-    file_id: int,
-) -> int:
+def iter_page_chunks(
+    pages: Iterable[dict],
+    excluded_pages: FrozenSet[int],
+    seen_chunks: List[str] = None,
+) -> Iterator[Tuple[str, int]]:
     """
-    Read a PDF from disk and generate up to max_new_cards cards for the given subject.
-    Returns the number of new cards added.
+    Yield (chunk_text, page) for every non-empty, non-excluded page, lazily so
+    extraction, chunking and LLM calls overlap. Chunks are also appended to
+    seen_chunks when given (e.g. to index them for RAG afterwards).
     """
-    with open(pdf_path, "rb") as f:
-        file_bytes = f.read()
-
-    pages = extract_pages_from_pdf_bytes(file_bytes)
-
-    deck: List[QAItem] = st.session_state.deck
-    current_id = max((c.id for c in deck), default=0) + 1
-    new_cards_count = 0
-
-    # Existing normalized questions for this subject (for dedup)
-    existing_norm_questions = [
-        normalize_text(c.question) for c in deck if c.subject_id == subject_id
-    ]
-
-    excluded_pages = get_excluded_pages_map(file_id)  # you need file_id param in function
-
     for page_info in pages:
-        if new_cards_count >= max_new_cards:
-            break
-
         page_number = page_info["page"]
         # SKIP excluded pages
         if page_number in excluded_pages:
@@ -298,33 +409,57 @@ def generate_cards_from_pdf_path(
         if not text.strip():
             continue
 
-        chunks = chunk_page_text(text)
-
-        for chunk in chunks:
-            if new_cards_count >= max_new_cards:
-                break
+        for chunk in chunk_page_text(text):
+            if seen_chunks is not None:
+                seen_chunks.append(chunk)
+            yield chunk, page_number
 
-            remaining = max_new_cards - new_cards_count
-            per_chunk_limit = min(7, remaining)
 
-            new_items = generate_cards_from_chunk(
-                chunk_text=chunk,
-                page=page_number,
-                source_pdf=pdf_name,
-                subject_id=subject_id,
-                starting_id=current_id,
-                max_items_for_this_chunk=per_chunk_limit,
-                existing_norm_questions=existing_norm_questions,
-            )
-
-            if len(new_items) > remaining:
-                new_items = new_items[:remaining]
-
-            for card in new_items:
-                insert_card(card)
-                deck.append(card)
+def generate_cards_from_pdf_path(
+    pdf_path: str,
+    pdf_name: str,
+    subject_id: int,
+    max_new_cards: int,
+    file_id: int,
+    existing_norm_questions: Set[str] = None,
+    rag_chunks: List[str] = None,
+) -> int:
+    """
+    Read a PDF from disk and generate up to max_new_cards cards for the given subject.
+    The file is read lazily from disk (memory-mapped by MuPDF), never buffered whole.
+    When rag_chunks is given, every non-excluded chunk of the file is appended
+    to it for indexing, including pages past the point where the card budget
+    ran out. Returns the number of new cards added.
+    """
+    # No budget left and nothing to index: don't open, extract or chunk the PDF
+    if max_new_cards <= 0 and rag_chunks is None:
+        return 0
 
-            new_cards_count += len(new_items)
-            current_id += len(new_items)
+    pages = iter_pages_from_pdf_path(pdf_path)
 
-    return new_cards_count
\ No newline at end of file
+    # Existing normalized questions for this subject (for dedup)
+    if existing_norm_questions is None:
+        existing_norm_questions = {
+            normalize_text(q) for q in get_subject_questions(subject_id)
+        }
+
+    excluded_pages = cached_get_excluded_pages_map(file_id)
+
+    chunks = iter_page_chunks(pages, excluded_pages, seen_chunks=rag_chunks)
+    new_items = generate_cards_from_chunks(
+        chunks,
+        source_pdf=pdf_name,
+        subject_id=subject_id,
+        max_items=max_new_cards,
+        existing_norm_questions=existing_norm_questions,
+    )
+
+    # Generation stops at the budget; read the rest of the file for the index
+    if rag_chunks is not None:
+        for _ in chunks:
+            pass
+
+    # Persist this file's cards in a single transaction
+    insert_cards_bulk(new_items)
+
+    return len(new_items)
@@ -13,4 +13,8 @@ REG_RATE_WINDOW = timedelta(minutes=10)
 
 # Global CSS for layout
 CUSTOM_CSS = """
+<style>
+.qa-card { border: 1px solid #ccc; padding: 1rem; border-radius: 0.5rem; }
+.qa-answer { background: #f8f8f8; }
+</style>
 """  # you can put your CSS here
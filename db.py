@@ -1,12 +1,16 @@
 # db.py
 import os
+import queue
 import sqlite3
-from typing import List, Optional, Tuple, Dict
+import threading
+from contextlib import contextmanager
+from typing import List, Optional, Tuple, Dict, FrozenSet
 from pathlib import Path
-from datetime import date, datetime, timedelta
+from datetime import date, datetime, timedelta, timezone
 import json
 
 import bcrypt
+import streamlit as st
 
 from models import QAItem
 
@@ -20,53 +24,84 @@ DB_PATH = Path(os.getenv("APP_DB_PATH", DEFAULT_DB_PATH))
 DB_PATH.parent.mkdir(parents=True, exist_ok=True)
 
 
+# Per-connection tuning. journal_mode=WAL is persistent and set once in init_db;
+# with WAL, readers (e.g. get_due_cards during a review) are not blocked by a
+# PDF-generation write transaction, and synchronous=NORMAL is durable enough.
+_CONNECTION_PRAGMAS = """
+    PRAGMA foreign_keys=ON;
+    PRAGMA synchronous=NORMAL;
+    PRAGMA temp_store=MEMORY;
+    PRAGMA cache_size=-65536;
+    PRAGMA mmap_size=268435456;
+"""
+
+
 def get_connection():
     # check_same_thread=False allows use with Streamlit
-    return sqlite3.connect(DB_PATH, check_same_thread=False)
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False, cached_statements=256)
+    # Child rows (subjects, cards, attempts, uploads) cascade on delete
+    conn.executescript(_CONNECTION_PRAGMAS)
+    return conn
 
 
-def init_db():
-    conn = get_connection()
-    cursor = conn.cursor()
+# Small pool: N read connections plus one writer serialized by a lock
+# (SQLite allows a single writer at a time anyway).
+_READ_POOL_SIZE = 4
 
-    # Users
-    cursor.execute(
-        """
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            password_hash TEXT NOT NULL,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-        );
-        """
-    )
 
-    # Ensure default admin user exists
-    cursor.execute("SELECT id FROM users WHERE username = 'admin'")
-    if cursor.fetchone() is None:
-        pw_hash = bcrypt.hashpw("admin123".encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
-        cursor.execute(
-            "INSERT INTO users (username, password_hash) VALUES (?, ?)",
-            ("admin", pw_hash),
-        )
+@st.cache_resource
+def get_pool():
+    """
+    Process-wide pool of warm connections (PRAGMAs applied, page cache kept).
+    Returns (read_queue, writer_connection, writer_lock).
+    """
+    readers = queue.Queue()
+    for _ in range(_READ_POOL_SIZE):
+        readers.put(get_connection())
+    return readers, get_connection(), threading.Lock()
 
-    # Subjects (per user)
-    cursor.execute(
-        """
-        CREATE TABLE IF NOT EXISTS subjects (
+
+@contextmanager
+def pooled_connection(write: bool = False):
+    """
+    Borrow a pooled connection. With write=True the dedicated writer is used
+    under the writer lock and the transaction is committed (or rolled back on
+    error) on exit. Pooled connections must NOT be closed.
+    """
+    readers, writer, write_lock = get_pool()
+    if write:
+        with write_lock:
+            try:
+                yield writer
+                writer.commit()
+            except BaseException:
+                writer.rollback()
+                raise
+        return
+
+    conn = readers.get()
+    try:
+        yield conn
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+        readers.put(conn)
+
+
+# Schemas for tables with foreign keys. `{name}` lets _migrate_cascades
+# rebuild a pre-cascade table under a temporary name.
+_SUBJECTS_DDL = """
+        CREATE TABLE IF NOT EXISTS {name} (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             name TEXT NOT NULL,
             user_id INTEGER NOT NULL,
             UNIQUE(name, user_id),
-            FOREIGN KEY(user_id) REFERENCES users(id)
+            FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
         );
         """
-    )
 
-    # Cards with SRS fields
-    cursor.execute(
-        """
-        CREATE TABLE IF NOT EXISTS cards (
+_CARDS_DDL = """
+        CREATE TABLE IF NOT EXISTS {name} (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             card_type TEXT NOT NULL,
             question TEXT NOT NULL,
@@ -84,15 +119,12 @@ def init_db():
             last_review TEXT,
             lapse_count INTEGER NOT NULL DEFAULT 0,
 
-            FOREIGN KEY(subject_id) REFERENCES subjects(id)
+            FOREIGN KEY(subject_id) REFERENCES subjects(id) ON DELETE CASCADE
         );
         """
-    )
 
-    # Attempts history (for progress stats), per user
-    cursor.execute(
-        """
-        CREATE TABLE IF NOT EXISTS card_attempts (
+_CARD_ATTEMPTS_DDL = """
+        CREATE TABLE IF NOT EXISTS {name} (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             card_id INTEGER NOT NULL,
             subject_id INTEGER NOT NULL,
@@ -100,17 +132,14 @@ def init_db():
             is_correct INTEGER NOT NULL,
             quality INTEGER NOT NULL, -- 0-5
             timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY(card_id) REFERENCES cards(id),
-            FOREIGN KEY(subject_id) REFERENCES subjects(id),
-            FOREIGN KEY(user_id) REFERENCES users(id)
+            FOREIGN KEY(card_id) REFERENCES cards(id) ON DELETE CASCADE,
+            FOREIGN KEY(subject_id) REFERENCES subjects(id) ON DELETE CASCADE,
+            FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
         );
         """
-    )
 
-    # Uploaded files metadata
-    cursor.execute(
-        """
-        CREATE TABLE IF NOT EXISTS uploaded_files (
+_UPLOADED_FILES_DDL = """
+        CREATE TABLE IF NOT EXISTS {name} (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             user_id INTEGER NOT NULL,
             subject_id INTEGER NOT NULL,
@@ -118,25 +147,113 @@ def init_db():
             stored_path TEXT NOT NULL,
             uploaded_at DATETIME DEFAULT CURRENT_TIMESTAMP,
             excluded_pages TEXT DEFAULT '',
-            FOREIGN KEY(user_id) REFERENCES users(id),
-            FOREIGN KEY(subject_id) REFERENCES subjects(id)
+            FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE,
+            FOREIGN KEY(subject_id) REFERENCES subjects(id) ON DELETE CASCADE
         );
         """
-    )
 
-    # Admin action logs (impersonation, destructive actions, etc.)
-    cursor.execute(
-        """
-        CREATE TABLE IF NOT EXISTS admin_logs (
+# target_user_id deliberately has no foreign key: the "Deleted user account"
+# entry is written after the target user row is gone.
+_ADMIN_LOGS_DDL = """
+        CREATE TABLE IF NOT EXISTS {name} (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             admin_id INTEGER NOT NULL,
             target_user_id INTEGER NOT NULL,
             action TEXT NOT NULL,
             timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY(admin_id) REFERENCES users(id),
-            FOREIGN KEY(target_user_id) REFERENCES users(id)
+            FOREIGN KEY(admin_id) REFERENCES users(id) ON DELETE CASCADE
         );
         """
+
+_CASCADE_TABLES = [
+    ("subjects", _SUBJECTS_DDL),
+    ("cards", _CARDS_DDL),
+    ("card_attempts", _CARD_ATTEMPTS_DDL),
+    ("uploaded_files", _UPLOADED_FILES_DDL),
+    ("admin_logs", _ADMIN_LOGS_DDL),
+]
+
+
+def _migrate_cascades(cursor):
+    """
+    Rebuild tables created before foreign keys cascaded on delete.
+    Uses SQLite's create-copy-drop-rename procedure; foreign_keys must be OFF.
+    """
+    for table, ddl in _CASCADE_TABLES:
+        fks = cursor.execute(f"PRAGMA foreign_key_list({table})").fetchall()
+        expected = ddl.count("FOREIGN KEY")
+        # row[6] is the ON DELETE action
+        if len(fks) == expected and all(fk[6] == "CASCADE" for fk in fks):
+            continue
+
+        new_table = f"{table}_new"
+        cursor.execute(f"DROP TABLE IF EXISTS {new_table}")
+        cursor.execute(ddl.format(name=new_table))
+        old_cols = {r[1] for r in cursor.execute(f"PRAGMA table_info({table})")}
+        new_cols = [r[1] for r in cursor.execute(f"PRAGMA table_info({new_table})")]
+        cols = ", ".join(c for c in new_cols if c in old_cols)
+        cursor.execute(f"INSERT INTO {new_table} ({cols}) SELECT {cols} FROM {table}")
+        cursor.execute(f"DROP TABLE {table}")
+        cursor.execute(f"ALTER TABLE {new_table} RENAME TO {table}")
+
+
+def init_db():
+    conn = get_connection()
+    # WAL is a property of the database file, so it only needs setting once
+    conn.execute("PRAGMA journal_mode=WAL")
+    # Off while (re)building tables; every regular connection turns it back on
+    conn.execute("PRAGMA foreign_keys=OFF")
+    cursor = conn.cursor()
+
+    # Users
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        );
+        """
+    )
+
+    # Subjects (per user), cards with SRS fields, attempts history (for
+    # progress stats, per user), uploaded files metadata, and admin action
+    # logs (impersonation, destructive actions, etc.)
+    for table, ddl in _CASCADE_TABLES:
+        cursor.execute(ddl.format(name=table))
+
+    _migrate_cascades(cursor)
+    conn.commit()
+
+    # Ensure default admin user exists
+    cursor.execute("SELECT id FROM users WHERE username = 'admin'")
+    if cursor.fetchone() is None:
+        pw_hash = bcrypt.hashpw("admin123".encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+        cursor.execute(
+            "INSERT INTO users (username, password_hash) VALUES (?, ?)",
+            ("admin", pw_hash),
+        )
+
+    # Indexes for per-user lookups and cascading deletes
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_uf_user ON uploaded_files(user_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_cards_subject ON cards(subject_id)")
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_cards_subject_type ON cards(subject_id, card_type)"
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_attempts_card_user ON card_attempts(card_id, user_id)"
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_attempts_user ON card_attempts(user_id)"
+    )
+    # Covers the per-file card counts in the file management list
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_cards_subject_pdf ON cards(subject_id, source_pdf)"
+    )
+    # Due-card lookups on every Flashcards rerun: range scan already in due order
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_cards_subject_due ON cards(subject_id, due_date)"
     )
 
     conn.commit()
@@ -145,6 +262,20 @@ def init_db():
 
 # ---------- User management ----------
 
+# Version for cached admin user lists. Process-wide rather than per session,
+# so every admin session sees users created, renamed or deleted elsewhere.
+_users_version = 0
+
+
+def users_version() -> int:
+    return _users_version
+
+
+def bump_users_version() -> None:
+    global _users_version
+    _users_version += 1
+
+
 def create_user(username: str, password_hash: str) -> bool:
     """
     Create a new user. Returns True on success, False if username already exists.
@@ -160,6 +291,7 @@ def create_user(username: str, password_hash: str) -> bool:
             (username, password_hash),
         )
         conn.commit()
+        bump_users_version()
         return True
     except sqlite3.IntegrityError:
         # username already exists
@@ -172,14 +304,13 @@ def get_user_by_username(username: str) -> Optional[Tuple[int, str, str]]:
     """
     Returns (id, username, password_hash) or None.
     """
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "SELECT id, username, password_hash FROM users WHERE username = ?",
-        (username,),
-    )
-    row = cursor.fetchone()
-    conn.close()
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT id, username, password_hash FROM users WHERE username = ?",
+            (username,),
+        )
+        row = cursor.fetchone()
     if row:
         return row[0], row[1], row[2]
     return None
@@ -197,6 +328,53 @@ def get_all_users() -> List[Tuple[int, str]]:
     return rows
 
 
+def count_users() -> int:
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) FROM users")
+    (total,) = cursor.fetchone()
+    conn.close()
+    return total
+
+
+def get_users_overview(
+    limit: int = 50,
+    offset: int = 0,
+    user_ids: Optional[List[int]] = None,
+) -> List[Tuple[int, str, int, int]]:
+    """
+    Returns one page of (id, username, uploaded_files_count, attempts_count),
+    aggregated in a single query so the admin page needs no per-user lookups.
+    If user_ids is given, only those users are considered.
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        SELECT p.id, p.username,
+               (SELECT COUNT(*) FROM uploaded_files f WHERE f.user_id = p.id),
+               (SELECT COUNT(*) FROM card_attempts a WHERE a.user_id = p.id)
+        FROM (
+            SELECT u.id, u.username
+            FROM users u
+            WHERE ? IS NULL OR u.id IN (SELECT value FROM json_each(?))
+            ORDER BY u.username
+            LIMIT ? OFFSET ?
+        ) p
+        ORDER BY p.username
+        """,
+        (
+            None if user_ids is None else 1,
+            json.dumps(user_ids) if user_ids is not None else "[]",
+            limit,
+            offset,
+        ),
+    )
+    rows = cursor.fetchall()
+    conn.close()
+    return rows
+
+
 def update_user_username(user_id: int, new_username: str) -> bool:
     """
     Update a user's username. Returns True on success, False if username already exists.
@@ -217,91 +395,61 @@ def update_user_username(user_id: int, new_username: str) -> bool:
 
 
 def update_user_password(user_id: int, password_hash: str) -> None:
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "UPDATE users SET password_hash = ? WHERE id = ?",
-        (password_hash, user_id),
-    )
-    conn.commit()
-    conn.close()
-
-
-def delete_user(user_id: int) -> None:
-    """
-    Delete a user and all their dependent data (subjects, cards, attempts, uploads, logs).
-    Does not delete physical files on disk (handled in app).
-    """
-    conn = get_connection()
-    cursor = conn.cursor()
-
-    # Get subject ids for this user
-    cursor.execute("SELECT id FROM subjects WHERE user_id = ?", (user_id,))
-    subj_rows = cursor.fetchall()
-    subj_ids = [r[0] for r in subj_rows]
-
-    card_ids: List[int] = []
-    if subj_ids:
-        placeholders = ",".join("?" * len(subj_ids))
-        cursor.execute(
-            f"SELECT id FROM cards WHERE subject_id IN ({placeholders})",
-            subj_ids,
+    with pooled_connection(write=True) as conn:
+        conn.execute(
+            "UPDATE users SET password_hash = ? WHERE id = ?",
+            (password_hash, user_id),
         )
-        card_rows = cursor.fetchall()
-        card_ids = [r[0] for r in card_rows]
 
-    # Delete attempts by user_id
-    cursor.execute("DELETE FROM card_attempts WHERE user_id = ?", (user_id,))
 
-    # Delete attempts by cards (in case some are from other users, but tied to user's subjects)
-    if card_ids:
-        placeholders = ",".join("?" * len(card_ids))
-        cursor.execute(
-            f"DELETE FROM card_attempts WHERE card_id IN ({placeholders})",
-            card_ids,
-        )
+_HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
 
-    # Delete cards
-    if card_ids:
-        placeholders = ",".join("?" * len(card_ids))
-        cursor.execute(
-            f"DELETE FROM cards WHERE id IN ({placeholders})",
-            card_ids,
-        )
 
-    # Delete uploaded_files
-    cursor.execute("DELETE FROM uploaded_files WHERE user_id = ?", (user_id,))
-
-    # Delete subjects
-    cursor.execute("DELETE FROM subjects WHERE user_id = ?", (user_id,))
+def delete_uploaded_files_returning_paths(cur, where: str, params) -> list:
+    """
+    Delete uploaded_files rows matching `where` (a trusted SQL fragment) and
+    return their stored paths, using DELETE ... RETURNING when SQLite supports it.
+    """
+    if _HAS_RETURNING:
+        cur.execute(f"DELETE FROM uploaded_files WHERE {where} RETURNING stored_path", params)
+        return [r[0] for r in cur.fetchall()]
 
-    # Delete admin logs
-    cursor.execute(
-        "DELETE FROM admin_logs WHERE admin_id = ? OR target_user_id = ?",
-        (user_id, user_id),
-    )
+    cur.execute(f"SELECT stored_path FROM uploaded_files WHERE {where}", params)
+    paths = [r[0] for r in cur.fetchall()]
+    cur.execute(f"DELETE FROM uploaded_files WHERE {where}", params)
+    return paths
 
-    # Finally delete user
-    cursor.execute("DELETE FROM users WHERE id = ?", (user_id,))
 
-    conn.commit()
-    conn.close()
+def delete_user(user_id: int) -> List[str]:
+    """
+    Delete a user and all their dependent data (subjects, cards, attempts, uploads, logs)
+    in one transaction. Returns the stored paths of their uploaded files; removing
+    the physical files is left to the caller, after this has committed.
+    """
+    with pooled_connection(write=True) as conn:
+        cur = conn.cursor()
+        # Collect stored paths before the cascade removes the rows
+        stored_paths = delete_uploaded_files_returning_paths(cur, "user_id = ?", (user_id,))
+        # admin_logs.target_user_id has no foreign key, so those rows go explicitly
+        cur.execute("DELETE FROM admin_logs WHERE target_user_id = ?", (user_id,))
+        # Subjects, cards, attempts and the user's own admin logs cascade inside SQLite
+        cur.execute("DELETE FROM users WHERE id = ?", (user_id,))
+    bump_users_version()
+    return stored_paths
 
 
 # ---------- Admin logs ----------
 
 def admin_log(admin_id: int, target_user_id: int, action: str) -> None:
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        """
-        INSERT INTO admin_logs (admin_id, target_user_id, action)
-        VALUES (?, ?, ?)
-        """,
-        (admin_id, target_user_id, action),
-    )
-    conn.commit()
-    conn.close()
+    with pooled_connection(write=True) as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            INSERT INTO admin_logs (admin_id, target_user_id, action)
+            VALUES (?, ?, ?)
+            """,
+            (admin_id, target_user_id, action),
+        )
 
 
 def get_admin_logs(limit: int = 200) -> List[Dict]:
@@ -331,40 +479,35 @@ def get_admin_logs(limit: int = 200) -> List[Dict]:
 
 # ---------- SRS & card operations ----------
 
-def record_attempt(card_id: int, subject_id: int, user_id: int, is_correct: bool, quality: int):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        """
-        INSERT INTO card_attempts (card_id, subject_id, user_id, is_correct, quality)
-        VALUES (?, ?, ?, ?, ?)
-        """,
+# Hot-path SQL kept as module constants: sqlite3 caches prepared statements
+# per connection keyed by the exact SQL text, so pooled connections reuse
+# them instead of re-parsing on every review click.
+_INSERT_ATTEMPT_SQL = """
+    INSERT INTO card_attempts (card_id, subject_id, user_id, is_correct, quality)
+    VALUES (?, ?, ?, ?, ?)
+"""
+
+_SELECT_SRS_SQL = "SELECT ef, interval, repetitions FROM cards WHERE id = ?"
+
+_UPDATE_SCHEDULE_SQL = """
+    UPDATE cards
+    SET ef = ?, interval = ?, repetitions = ?,
+        due_date = ?, last_review = ?, lapse_count = lapse_count + ?
+    WHERE id = ?
+"""
+
+
+def _insert_attempt(conn, card_id: int, subject_id: int, user_id: int, is_correct: bool, quality: int):
+    conn.execute(
+        _INSERT_ATTEMPT_SQL,
         (card_id, subject_id, user_id, 1 if is_correct else 0, quality),
     )
-    conn.commit()
-    conn.close()
-
 
-def update_card_schedule(card_id: int, quality: int):
-    """
-    Update card's schedule using SM-2.
-    quality: 0-5
-    """
-    conn = get_connection()
-    cursor = conn.cursor()
 
+def _apply_schedule(conn, card_id: int, quality: int):
     # Load current SRS fields
-    cursor.execute(
-        """
-        SELECT ef, interval, repetitions
-        FROM cards
-        WHERE id = ?
-        """,
-        (card_id,),
-    )
-    row = cursor.fetchone()
+    row = conn.execute(_SELECT_SRS_SQL, (card_id,)).fetchone()
     if row is None:
-        conn.close()
         return
 
     ef, interval, repetitions = row
@@ -397,36 +540,125 @@ def update_card_schedule(card_id: int, quality: int):
     now_str = datetime.now().isoformat(timespec="seconds")
     due_str = due.isoformat()
 
-    cursor.execute(
-        """
-        UPDATE cards
-        SET ef = ?, interval = ?, repetitions = ?,
-            due_date = ?, last_review = ?, lapse_count = lapse_count + ?
-        WHERE id = ?
-        """,
+    conn.execute(
+        _UPDATE_SCHEDULE_SQL,
         (ef, interval, repetitions, due_str, now_str, lapse_increment, card_id),
     )
 
-    conn.commit()
-    conn.close()
+
+def record_attempt(card_id: int, subject_id: int, user_id: int, is_correct: bool, quality: int):
+    with pooled_connection(write=True) as conn:
+        _insert_attempt(conn, card_id, subject_id, user_id, is_correct, quality)
+    clear_stats_caches(subject_id)
+
+
+def update_card_schedule(card_id: int, quality: int):
+    """
+    Update card's schedule using SM-2.
+    quality: 0-5
+    """
+    with pooled_connection(write=True) as conn:
+        _apply_schedule(conn, card_id, quality)
+    _cached_due_cards.clear()
+
+
+def record_review(card_id: int, subject_id: int, user_id: int, quality: int):
+    """
+    Record an SRS review: the attempt and the SM-2 reschedule, committed
+    together as one transaction.
+    """
+    with pooled_connection(write=True) as conn:
+        _insert_attempt(conn, card_id, subject_id, user_id, quality >= 3, quality)
+        _apply_schedule(conn, card_id, quality)
+    _cached_due_cards.clear()
+    clear_stats_caches(subject_id)
 
 
 def get_due_cards(subject_id: int, limit: int = 100) -> List[QAItem]:
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        """
-        SELECT id, card_type, question, answer, source_pdf, page, subject_id, options
-        FROM cards
-        WHERE subject_id = ?
-          AND DATE(due_date) <= DATE('now')
-        ORDER BY due_date ASC, id ASC
-        LIMIT ?
-        """,
-        (subject_id, limit),
-    )
-    rows = cursor.fetchall()
-    conn.close()
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            SELECT id, card_type, question, answer, source_pdf, page, subject_id, options
+            FROM cards
+            WHERE subject_id = ?
+              AND due_date < DATE('now', '+1 day')
+            ORDER BY due_date ASC, id ASC
+            LIMIT ?
+            """,
+            (subject_id, limit),
+        )
+        rows = cursor.fetchall()
+
+    cards: List[QAItem] = []
+    for row in rows:
+        options_json = row[7]
+        options = json.loads(options_json) if options_json else None
+        cards.append(
+            QAItem(
+                id=row[0],
+                card_type=row[1],
+                question=row[2],
+                answer=row[3],
+                source_pdf=row[4],
+                page=row[5],
+                subject_id=row[6],
+                options=options,
+            )
+        )
+    return cards
+
+
+@st.cache_data(ttl=300, show_spinner=False)
+def _cached_due_cards(subject_id: int, limit: int, day: str) -> List[QAItem]:
+    # `day` only keys the cache, so entries roll over at (UTC) midnight like DATE('now')
+    return get_due_cards(subject_id, limit)
+
+
+def cached_get_due_cards(subject_id: int, limit: int = 100) -> List[QAItem]:
+    """get_due_cards() for reruns; cleared on reviews and card inserts/deletes."""
+    return _cached_due_cards(subject_id, limit, datetime.now(timezone.utc).date().isoformat())
+
+
+QUIZ_CARD_TYPES = ("short_answer", "fill_in_blank", "multiple_choice")
+
+
+def count_quiz_cards(subject_id: int, types: Tuple[str, ...] = QUIZ_CARD_TYPES) -> int:
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        placeholders = ",".join("?" * len(types))
+        cursor.execute(
+            f"SELECT COUNT(*) FROM cards WHERE subject_id = ? AND card_type IN ({placeholders})",
+            (subject_id, *types),
+        )
+        (n,) = cursor.fetchone()
+    return n
+
+
+def get_quiz_cards(
+    subject_id: int,
+    types: Tuple[str, ...] = QUIZ_CARD_TYPES,
+    limit: int = 200,
+    offset: int = 0,
+) -> List[QAItem]:
+    """
+    One page of a subject's cards of the given types, in id order
+    (served by idx_cards_subject_type).
+    """
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        placeholders = ",".join("?" * len(types))
+        cursor.execute(
+            f"""
+            SELECT id, card_type, question, answer, source_pdf, page, subject_id, options
+            FROM cards
+            WHERE subject_id = ? AND card_type IN ({placeholders})
+            ORDER BY id
+            LIMIT ? OFFSET ?
+            """,
+            (subject_id, *types, limit, offset),
+        )
+        rows = cursor.fetchall()
 
     cards: List[QAItem] = []
     for row in rows:
@@ -447,50 +679,218 @@ def get_due_cards(subject_id: int, limit: int = 100) -> List[QAItem]:
     return cards
 
 
+@st.cache_data(ttl=30, show_spinner=False)
+def cached_quiz_page(
+    subject_id: int,
+    offset: int = 0,
+    limit: int = 200,
+    types: Tuple[str, ...] = QUIZ_CARD_TYPES,
+) -> Tuple[int, List[QAItem]]:
+    """(total quiz cards, one page of them), cached together so they stay consistent."""
+    return count_quiz_cards(subject_id, types), get_quiz_cards(subject_id, types, limit, offset)
+
+
+def get_subject_cards(subject_id: int) -> List[QAItem]:
+    """All cards of one subject, in id order."""
+    with pooled_connection() as conn:
+        rows = conn.execute(
+            """
+            SELECT id, card_type, question, answer, source_pdf, page, subject_id, options
+            FROM cards
+            WHERE subject_id = ?
+            ORDER BY id
+            """,
+            (subject_id,),
+        ).fetchall()
+    return [
+        QAItem(
+            id=row[0],
+            card_type=row[1],
+            question=row[2],
+            answer=row[3],
+            source_pdf=row[4],
+            page=row[5],
+            subject_id=row[6],
+            options=json.loads(row[7]) if row[7] else None,
+        )
+        for row in rows
+    ]
+
+
+@st.cache_data(ttl=60, show_spinner=False)
+def cached_subject_cards(subject_id: int) -> List[QAItem]:
+    """get_subject_cards() for the card deletion grid; cleared when cards change."""
+    return get_subject_cards(subject_id)
+
+
+def get_subject_questions(subject_id: int) -> List[str]:
+    """Question texts of one subject (for dedup), without loading whole cards."""
+    with pooled_connection() as conn:
+        rows = conn.execute(
+            "SELECT question FROM cards WHERE subject_id = ?", (subject_id,)
+        ).fetchall()
+    return [r[0] for r in rows]
+
+
+def count_user_cards(user_id: int) -> int:
+    with pooled_connection() as conn:
+        (n,) = conn.execute(
+            """
+            SELECT COUNT(*)
+            FROM cards c
+            JOIN subjects s ON c.subject_id = s.id
+            WHERE s.user_id = ?
+            """,
+            (user_id,),
+        ).fetchone()
+    return n
+
+
+@st.cache_data(ttl=60, show_spinner=False)
+def cached_count_user_cards(user_id: int) -> int:
+    """count_user_cards() for the per-rerun deck size; cleared when cards change."""
+    return count_user_cards(user_id)
+
+
+def clear_card_caches() -> None:
+    """Drop cached card queries (after inserting or deleting cards)."""
+    cached_quiz_page.clear()
+    _cached_due_cards.clear()
+    cached_card_counts_by_file.clear()
+    cached_subject_cards.clear()
+    cached_count_user_cards.clear()
+    clear_stats_caches()
+
+
 def get_subject_stats(subject_id: int, user_id: int):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        """
-        SELECT COUNT(*), SUM(is_correct)
-        FROM card_attempts
-        WHERE subject_id = ? AND user_id = ?
-        """,
-        (subject_id, user_id),
-    )
-    total, correct = cursor.fetchone()
-    conn.close()
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            SELECT COUNT(*), SUM(is_correct)
+            FROM card_attempts
+            WHERE subject_id = ? AND user_id = ?
+            """,
+            (subject_id, user_id),
+        )
+        total, correct = cursor.fetchone()
     return total or 0, correct or 0
 
 
 def get_card_stats(card_id: int, user_id: int):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        """
-        SELECT COUNT(*), SUM(is_correct)
-        FROM card_attempts
-        WHERE card_id = ? AND user_id = ?
-        """,
-        (card_id, user_id),
-    )
-    total, correct = cursor.fetchone()
-    conn.close()
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            SELECT COUNT(*), SUM(is_correct)
+            FROM card_attempts
+            WHERE card_id = ? AND user_id = ?
+            """,
+            (card_id, user_id),
+        )
+        total, correct = cursor.fetchone()
     return total or 0, correct or 0
 
 
-def insert_card(card: QAItem):
-    conn = get_connection()
-    cursor = conn.cursor()
+def get_subject_card_stats(subject_id: int, user_id: int) -> List[Tuple[int, str, int, int]]:
+    """
+    Per-card attempt aggregates for a whole subject in one query:
+    [(card_id, question, attempts, correct), ...] in card id order.
+    Replaces calling get_card_stats once per card.
+    """
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            SELECT c.id, c.question, COUNT(a.id), COALESCE(SUM(a.is_correct), 0)
+            FROM cards c
+            LEFT JOIN card_attempts a ON a.card_id = c.id AND a.user_id = ?
+            WHERE c.subject_id = ?
+            GROUP BY c.id
+            ORDER BY c.id
+            """,
+            (user_id, subject_id),
+        )
+        rows = cursor.fetchall()
+    return rows
+
+
+@st.cache_data(ttl=60, max_entries=64, show_spinner=False)
+def cached_subject_card_stats(
+    subject_id: int, user_id: int, version: Tuple[int, int]
+) -> List[Tuple[int, str, int, int]]:
+    """get_subject_card_stats() for the Progress tab; `version` is stats_version(subject_id)."""
+    return get_subject_card_stats(subject_id, user_id)
+
+
+# Stats cache versions: a global generation for changes that can touch any
+# subject (card inserts/deletes), plus a per-subject counter for attempts.
+# Keying caches on them invalidates only the entries that changed.
+_stats_generation = 0
+_subject_stats_versions: Dict[int, int] = {}
+
+
+def stats_version(subject_id: int) -> Tuple[int, int]:
+    return _stats_generation, _subject_stats_versions.get(subject_id, 0)
+
+
+def clear_stats_caches(subject_id: Optional[int] = None) -> None:
+    """
+    Invalidate cached attempt aggregates: for one subject after recording an
+    attempt, or for every subject when subject_id is None.
+    """
+    global _stats_generation
+    if subject_id is None:
+        _stats_generation += 1
+    else:
+        _subject_stats_versions[subject_id] = _subject_stats_versions.get(subject_id, 0) + 1
+
+
+def insert_card(card: QAItem) -> int:
+    """
+    Insert a card and return its new id, which is also set on card.id
+    (ids are owned by SQLite, not allocated from the in-memory deck).
+    """
     options_json = json.dumps(card.options) if card.options is not None else None
-    cursor.execute(
-        """
-        INSERT INTO cards (
-            card_type, question, answer, source_pdf, page, subject_id,
-            options, ef, interval, repetitions, due_date, last_review, lapse_count
+    with pooled_connection(write=True) as conn:
+        cursor = conn.execute(
+            """
+            INSERT INTO cards (
+                card_type, question, answer, source_pdf, page, subject_id,
+                options, ef, interval, repetitions, due_date, last_review, lapse_count
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                card.card_type,
+                card.question,
+                card.answer,
+                card.source_pdf,
+                card.page,
+                card.subject_id,
+                options_json,
+                2.5,  # ef default
+                0,    # interval
+                0,    # repetitions
+                date.today().isoformat(),  # due today initially
+                None,  # last_review
+                0,     # lapse_count
+            ),
         )
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """,
+        card.id = cursor.lastrowid
+    clear_card_caches()
+    return card.id
+
+
+def insert_cards_bulk(cards: List[QAItem]) -> None:
+    """
+    Insert many cards in one transaction (a single commit/fsync for the batch),
+    setting each card.id to its new database id.
+    """
+    if not cards:
+        return
+    today = date.today().isoformat()
+    rows = [
         (
             card.card_type,
             card.question,
@@ -498,17 +898,34 @@ def insert_card(card: QAItem):
             card.source_pdf,
             card.page,
             card.subject_id,
-            options_json,
+            json.dumps(card.options) if card.options is not None else None,
             2.5,  # ef default
             0,    # interval
             0,    # repetitions
-            date.today().isoformat(),  # due today initially
+            today,  # due today initially
             None,  # last_review
             0,     # lapse_count
-        ),
-    )
-    conn.commit()
-    conn.close()
+        )
+        for card in cards
+    ]
+    with pooled_connection(write=True) as conn:
+        cursor = conn.cursor()
+        cursor.executemany(
+            """
+            INSERT INTO cards (
+                card_type, question, answer, source_pdf, page, subject_id,
+                options, ef, interval, repetitions, due_date, last_review, lapse_count
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            rows,
+        )
+        # cards.id is AUTOINCREMENT and this transaction is the only writer,
+        # so the batch got consecutive ids ending at last_insert_rowid()
+        last_id = cursor.execute("SELECT last_insert_rowid()").fetchone()[0]
+        for card_id, card in enumerate(cards, start=last_id - len(cards) + 1):
+            card.id = card_id
+    clear_card_caches()
 
 
 def load_all_cards(user_id: Optional[int] = None) -> List[QAItem]:
@@ -516,31 +933,29 @@ def load_all_cards(user_id: Optional[int] = None) -> List[QAItem]:
     If user_id is provided, load only cards whose subject belongs to that user.
     Otherwise load all cards.
     """
-    conn = get_connection()
-    cursor = conn.cursor()
-
-    if user_id is None:
-        cursor.execute(
-            """
-            SELECT id, card_type, question, answer, source_pdf, page, subject_id, options
-            FROM cards
-            """
-        )
-        rows = cursor.fetchall()
-    else:
-        cursor.execute(
-            """
-            SELECT c.id, c.card_type, c.question, c.answer,
-                   c.source_pdf, c.page, c.subject_id, c.options
-            FROM cards c
-            JOIN subjects s ON c.subject_id = s.id
-            WHERE s.user_id = ?
-            """,
-            (user_id,),
-        )
-        rows = cursor.fetchall()
-
-    conn.close()
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+
+        if user_id is None:
+            cursor.execute(
+                """
+                SELECT id, card_type, question, answer, source_pdf, page, subject_id, options
+                FROM cards
+                """
+            )
+            rows = cursor.fetchall()
+        else:
+            cursor.execute(
+                """
+                SELECT c.id, c.card_type, c.question, c.answer,
+                       c.source_pdf, c.page, c.subject_id, c.options
+                FROM cards c
+                JOIN subjects s ON c.subject_id = s.id
+                WHERE s.user_id = ?
+                """,
+                (user_id,),
+            )
+            rows = cursor.fetchall()
 
     cards: List[QAItem] = []
     for row in rows:
@@ -562,37 +977,40 @@ def load_all_cards(user_id: Optional[int] = None) -> List[QAItem]:
 
 
 def add_subject(name: str, user_id: int):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT OR IGNORE INTO subjects (name, user_id) VALUES (?, ?)",
-        (name, user_id),
-    )
-    conn.commit()
-    conn.close()
+    with pooled_connection(write=True) as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "INSERT OR IGNORE INTO subjects (name, user_id) VALUES (?, ?)",
+            (name, user_id),
+        )
+    cached_get_subjects.clear()
 
 
 def get_subjects(user_id: int):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "SELECT id, name FROM subjects WHERE user_id = ? ORDER BY name",
-        (user_id,),
-    )
-    rows = cursor.fetchall()
-    conn.close()
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT id, name FROM subjects WHERE user_id = ? ORDER BY name",
+            (user_id,),
+        )
+        rows = cursor.fetchall()
     return rows
 
 
+@st.cache_data(ttl=60, show_spinner=False)
+def cached_get_subjects(user_id: int):
+    """get_subjects() for the per-rerun sidebar; cleared by add_subject()."""
+    return get_subjects(user_id)
+
+
 def get_subject_id(name: str, user_id: int):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "SELECT id FROM subjects WHERE name = ? AND user_id = ?",
-        (name, user_id),
-    )
-    row = cursor.fetchone()
-    conn.close()
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT id FROM subjects WHERE name = ? AND user_id = ?",
+            (name, user_id),
+        )
+        row = cursor.fetchone()
     return row[0] if row else None
 
 
@@ -603,18 +1021,17 @@ def insert_uploaded_file(user_id: int, subject_id: int, filename: str, stored_pa
     Store metadata for an uploaded PDF file.
     Returns the new uploaded_files.id.
     """
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        """
-        INSERT INTO uploaded_files (user_id, subject_id, filename, stored_path)
-        VALUES (?, ?, ?, ?)
-        """,
-        (user_id, subject_id, filename, stored_path),
-    )
-    conn.commit()
-    file_id = cursor.lastrowid
-    conn.close()
+    with pooled_connection(write=True) as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            INSERT INTO uploaded_files (user_id, subject_id, filename, stored_path)
+            VALUES (?, ?, ?, ?)
+            """,
+            (user_id, subject_id, filename, stored_path),
+        )
+        file_id = cursor.lastrowid
+    cached_get_uploaded_files.clear()
     return file_id
 
 
@@ -623,19 +1040,18 @@ def get_uploaded_files(user_id: int, subject_id: int):
     Return a list of dicts: [{id, filename, stored_path, uploaded_at}, ...]
     for this user & subject.
     """
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        """
-        SELECT id, filename, stored_path, uploaded_at
-        FROM uploaded_files
-        WHERE user_id = ? AND subject_id = ?
-        ORDER BY uploaded_at DESC
-        """,
-        (user_id, subject_id),
-    )
-    rows = cursor.fetchall()
-    conn.close()
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            SELECT id, filename, stored_path, uploaded_at
+            FROM uploaded_files
+            WHERE user_id = ? AND subject_id = ?
+            ORDER BY uploaded_at DESC
+            """,
+            (user_id, subject_id),
+        )
+        rows = cursor.fetchall()
     return [
         {
             "id": r[0],
@@ -647,6 +1063,28 @@ def get_uploaded_files(user_id: int, subject_id: int):
     ]
 
 
+@st.cache_data(ttl=60, show_spinner=False)
+def cached_get_uploaded_files(user_id: int, subject_id: int):
+    """get_uploaded_files() for the per-rerun file list; cleared on upload/delete."""
+    return get_uploaded_files(user_id, subject_id)
+
+
+def get_card_counts_by_file(subject_id: int) -> Dict[str, int]:
+    """{source_pdf: number of cards} for one subject (served by idx_cards_subject_pdf)."""
+    with pooled_connection() as conn:
+        rows = conn.execute(
+            "SELECT source_pdf, COUNT(*) FROM cards WHERE subject_id = ? GROUP BY source_pdf",
+            (subject_id,),
+        ).fetchall()
+    return dict(rows)
+
+
+@st.cache_data(ttl=60, show_spinner=False)
+def cached_card_counts_by_file(subject_id: int) -> Dict[str, int]:
+    """get_card_counts_by_file() for the file list; cleared when cards change."""
+    return get_card_counts_by_file(subject_id)
+
+
 def delete_uploaded_file_and_cards(uploaded_file_id: int, user_id: int) -> Optional[str]:
     """
     Delete a file metadata row and ALL cards + attempts referencing that file
@@ -671,32 +1109,17 @@ def delete_uploaded_file_and_cards(uploaded_file_id: int, user_id: int) -> Optio
 
     _, filename, stored_path, subject_id = row
 
-    # Find cards belonging to that subject + source_pdf = filename
+    # Delete cards belonging to that subject + source_pdf = filename;
+    # their attempts cascade
     cursor.execute(
         """
-        SELECT c.id
-        FROM cards c
-        JOIN subjects s ON c.subject_id = s.id
-        WHERE c.subject_id = ?
-          AND c.source_pdf = ?
-          AND s.user_id = ?
+        DELETE FROM cards
+        WHERE subject_id = ?
+          AND source_pdf = ?
+          AND subject_id IN (SELECT id FROM subjects WHERE user_id = ?)
         """,
         (subject_id, filename, user_id),
     )
-    card_rows = cursor.fetchall()
-    card_ids = [r[0] for r in card_rows]
-
-    # Delete attempts & cards
-    if card_ids:
-        placeholders = ",".join("?" * len(card_ids))
-        cursor.execute(
-            f"DELETE FROM card_attempts WHERE card_id IN ({placeholders})",
-            card_ids,
-        )
-        cursor.execute(
-            f"DELETE FROM cards WHERE id IN ({placeholders})",
-            card_ids,
-        )
 
     # Delete uploaded_files row
     cursor.execute(
@@ -706,6 +1129,8 @@ def delete_uploaded_file_and_cards(uploaded_file_id: int, user_id: int) -> Optio
 
     conn.commit()
     conn.close()
+    clear_file_caches()
+    clear_card_caches()
     return stored_path
 
 
@@ -738,28 +1163,60 @@ def delete_card(card_id: int, user_id: int) -> bool:
 
     conn.commit()
     conn.close()
+    clear_card_caches()
     return True
 
+
+def delete_cards(card_ids: List[int], user_id: int) -> List[int]:
+    """
+    Delete many cards owned by this user in one transaction; their attempts
+    cascade. Returns the ids that were actually deleted.
+    """
+    ids = list(dict.fromkeys(card_ids))
+    if not ids:
+        return []
+    with pooled_connection(write=True) as conn:
+        cursor = conn.cursor()
+        # Ids are bound as one JSON array so the SQL text (and its cached
+        # prepared statement) is the same for any number of cards
+        cursor.execute(
+            """
+            SELECT c.id
+            FROM cards c
+            JOIN subjects s ON c.subject_id = s.id
+            WHERE c.id IN (SELECT value FROM json_each(?)) AND s.user_id = ?
+            """,
+            (json.dumps(ids), user_id),
+        )
+        deleted = [r[0] for r in cursor.fetchall()]
+        if deleted:
+            cursor.execute(
+                "DELETE FROM cards WHERE id IN (SELECT value FROM json_each(?))",
+                (json.dumps(deleted),),
+            )
+    if deleted:
+        clear_card_caches()
+    return deleted
+
+
 def update_excluded_pages(file_id: int, excluded: str):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
-        "UPDATE uploaded_files SET excluded_pages=? WHERE id=?",
-        (excluded, file_id)
-    )
-    conn.commit()
-    conn.close()
+    with pooled_connection(write=True) as conn:
+        cur = conn.cursor()
+        cur.execute(
+            "UPDATE uploaded_files SET excluded_pages=? WHERE id=?",
+            (excluded, file_id)
+        )
+    cached_get_excluded_pages_map.clear()
 
 
-def get_excluded_pages_map(file_id: int) -> list[int]:
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT excluded_pages FROM uploaded_files WHERE id=?", (file_id,))
-    row = cur.fetchone()
-    conn.close()
+def get_excluded_pages_map(file_id: int) -> FrozenSet[int]:
+    with pooled_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT excluded_pages FROM uploaded_files WHERE id=?", (file_id,))
+        row = cur.fetchone()
 
     if not row or not row[0]:
-        return []
+        return frozenset()
 
     # parse formats like "1,2,5-8"
     text = row[0]
@@ -771,4 +1228,17 @@ def get_excluded_pages_map(file_id: int) -> list[int]:
             pages.extend(range(int(a), int(b) + 1))
         else:
             pages.append(int(part))
-    return pages
\ No newline at end of file
+    # Callers only test membership, once per page
+    return frozenset(pages)
+
+
+@st.cache_data(ttl=60, show_spinner=False)
+def cached_get_excluded_pages_map(file_id: int) -> FrozenSet[int]:
+    """get_excluded_pages_map() for the UI; cleared by update_excluded_pages()."""
+    return get_excluded_pages_map(file_id)
+
+
+def clear_file_caches() -> None:
+    """Drop cached uploaded-file lists and exclusions (after deleting files)."""
+    cached_get_uploaded_files.clear()
+    cached_get_excluded_pages_map.clear()
@@ -1,8 +1,12 @@
 from dataclasses import dataclass
+from functools import cached_property
 from typing import Literal, Optional
 
 CardType = Literal["flashcard", "short_answer", "fill_in_blank", "multiple_choice"]
 
+# Questions longer than this are shown truncated in lists and tables
+SHORT_QUESTION_LEN = 80
+
 @dataclass
 class QAItem:
     id: int
@@ -15,4 +19,19 @@ class QAItem:
     # Only for multiple choice:
     options: Optional[list[str]] = None
 
+    @cached_property
+    def short_question(self) -> str:
+        """Question truncated to SHORT_QUESTION_LEN chars, computed once."""
+        if len(self.question) <= SHORT_QUESTION_LEN:
+            return self.question
+        return self.question[: SHORT_QUESTION_LEN - 3] + "..."
+
+    @cached_property
+    def answer_norm_cs(self) -> str:
+        """Answer with surrounding whitespace stripped (case-sensitive checks)."""
+        return self.answer.strip()
 
+    @cached_property
+    def answer_norm(self) -> str:
+        """Stripped, lowercased answer for case-insensitive checks."""
+        return self.answer_norm_cs.lower()
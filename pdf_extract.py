@@ -0,0 +1,27 @@
+# pdf_extract.py
+# Kept free of app imports (Streamlit, LLM client, embedding model) so that
+# worker processes spawned for page extraction start quickly.
+from typing import List, Union
+
+import fitz  # PyMuPDF
+
+PdfSource = Union[str, bytes]
+
+
+def open_pdf(source: PdfSource):
+    """Open a PDF from a file path (memory-mapped by MuPDF) or from raw bytes."""
+    if isinstance(source, (bytes, bytearray)):
+        return fitz.open(stream=source, filetype="pdf")
+    return fitz.open(source)
+
+
+def extract_page_range(source: PdfSource, start: int, stop: int) -> List[dict]:
+    """Extract pages [start, stop) (0-based) as [{"page", "text"}, ...]."""
+    doc = open_pdf(source)
+    try:
+        return [
+            {"page": i + 1, "text": doc[i].get_text()}
+            for i in range(start, stop)
+        ]
+    finally:
+        doc.close()
@@ -1,4 +1,6 @@
 # rag_store.py
+import hashlib
+
 import faiss
 import numpy as np
 from pathlib import Path
@@ -21,11 +23,17 @@ def embed_text(texts: list[str]) -> np.ndarray:
 def load_or_create_index(user_id: int, subject_id: int, dim: int = 384):
     index_path, meta_path = _db_paths(user_id, subject_id)
 
-    if index_path.exists() and meta_path.exists():
-        index = faiss.read_index(str(index_path))
+    # EAFP: open the files directly instead of probing for them first.
+    # The index is read through Python so a missing file is FileNotFoundError
+    # (faiss.read_index reports it as a generic RuntimeError).
+    try:
+        with open(index_path, "rb") as f:
+            index = faiss.deserialize_index(np.fromfile(f, dtype=np.uint8))
         with open(meta_path, "rb") as f:
             meta = pickle.load(f)
         return index, meta
+    except FileNotFoundError:
+        pass
 
     index = faiss.IndexFlatL2(dim)
     meta = []
@@ -39,11 +47,29 @@ def save_index(user_id: int, subject_id: int, index, meta):
         pickle.dump(meta, f)
 
 
+def _chunk_key(text: str) -> bytes:
+    # Whitespace-insensitive content hash, so re-extracted chunks match
+    return hashlib.blake2b(" ".join(text.split()).encode("utf-8"), digest_size=16).digest()
+
+
 def add_documents(user_id: int, subject_id: int, docs: list[str]):
     index, meta = load_or_create_index(user_id, subject_id)
-    emb = embed_text(docs)
+
+    # Skip chunks already indexed (e.g. regenerating from the same PDF):
+    # embedding is the expensive part, hashing is not
+    seen = {_chunk_key(m) for m in meta}
+    new_docs = []
+    for doc in docs:
+        key = _chunk_key(doc)
+        if key not in seen:
+            seen.add(key)
+            new_docs.append(doc)
+    if not new_docs:
+        return
+
+    emb = embed_text(new_docs)
     index.add(emb)
-    meta.extend(docs)
+    meta.extend(new_docs)
     save_index(user_id, subject_id, index, meta)
 
 
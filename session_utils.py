@@ -1,18 +1,11 @@
 # session_utils.py
-from typing import List
-
 import streamlit as st
 
 from models import QAItem, CardType
-from db import load_all_cards, insert_card
+from db import insert_card
 
 
 def init_session_state(effective_user_id: int):
-    # Reload deck when effective user changes
-    if "deck_user_id" not in st.session_state or st.session_state.deck_user_id != effective_user_id:
-        st.session_state.deck: List[QAItem] = load_all_cards(effective_user_id)
-        st.session_state.deck_user_id = effective_user_id
-
     if "flashcard_index" not in st.session_state:
         st.session_state.flashcard_index = 0
     if "show_answer" not in st.session_state:
@@ -33,11 +26,8 @@ def add_manual_card(card_type: CardType, question: str, answer: str):
         st.error("Please select a subject before adding manual cards.")
         return
 
-    deck: List[QAItem] = st.session_state.deck
-    new_id = max((c.id for c in deck), default=0) + 1
-
     card = QAItem(
-        id=new_id,
+        id=0,  # assigned by insert_card
         card_type=card_type,
         question=question.strip(),
         answer=answer.strip(),
@@ -47,5 +37,4 @@ def add_manual_card(card_type: CardType, question: str, answer: str):
     )
 
     insert_card(card)
-    deck.append(card)
     st.success("Manual card added to the deck.")